@@ -0,0 +1,229 @@
+"""Replay many concurrent conversations through the agent loop offline.
+
+The real Calendar and Gemini clients are replaced by FakeCalendarService and
+StubLLM, so this runs anywhere. Conversations come from a conversations.json
+file in the notebook 01 format ({"conversations": [{"category", "messages":
+[{"role": "patient"|"assistant", "content"}]}]}) or are generated. Only the
+patient messages are replayed; the agent produces the replies.
+
+Reports throughput, p50/p95/p99 latency per stage, and (with --allocations)
+peak traced memory and the top allocation sites. --metrics also prints the
+agent's own Prometheus-style metrics and the slowest turn's trace.
+
+Usage: python benchmarks/bench_agent.py --conversations 200 --concurrency 16
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+import assistant
+import tracing
+from answer_cache import AnswerCache
+from calendar_cache import EventCache
+from fakes import FakeCalendarService, StubLLM
+
+FAQS = [
+    "How much does a crown cost?",
+    "Do you take Delta Dental?",
+    "What does Dr. Farhi specialize in?",
+    "Do you see children?",
+    "What sedation options do you offer?",
+    "What's your cancellation policy?",
+    "Where is the Christiana office located?",
+    "Do you offer financing?",
+]
+SERVICES = ["cleaning", "filling", "root canal", "crown", "extraction", "whitening"]
+LOCATIONS = ["Christiana", "Newport"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday"]
+NAMES = ["Sarah Johnson", "Mike Williams", "John Smith", "Priya Patel", "Luis Garcia", "Emma Brown"]
+
+
+def synthetic_conversations(n, rng):
+    conversations = []
+    for _ in range(n):
+        if rng.random() < 0.4:
+            messages = [rng.choice(FAQS) for _ in range(rng.randint(1, 3))]
+            category = "faq"
+        else:
+            messages = [
+                f"Hi, I need a {rng.choice(SERVICES)}",
+                f"{rng.choice(LOCATIONS)} please, {rng.choice(DAYS)} {rng.choice(['morning', 'afternoon'])} if possible",
+                f"That works, my name is {rng.choice(NAMES)}",
+                "Yes, please book it",
+            ]
+            category = "scheduling"
+        conversations.append({"category": category,
+                              "messages": [{"role": "patient", "content": m} for m in messages]})
+    return conversations
+
+
+def seed_calendar(service, events_per_day, rng):
+    today = datetime.now(assistant.est).date()
+    for offset in range(21):
+        day = today + timedelta(days=offset)
+        if day.weekday() > 3:
+            continue
+        for _ in range(events_per_day):
+            start = assistant.est.localize(datetime.combine(day, datetime.min.time().replace(hour=7, minute=30)))
+            start += timedelta(minutes=15 * rng.randrange(44))
+            service.add_event(start, start + timedelta(minutes=rng.choice([30, 45, 60, 90])))
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - t0)
+        return timed
+
+
+class TimedLLM:
+    # Times generate_content until the stream is fully consumed
+    def __init__(self, llm, timer):
+        self.llm = llm
+        self.timer = timer
+
+    def generate_content(self, prompt, stream=False):
+        self.timer.record("prompt_chars", len(prompt))
+        t0 = time.perf_counter()
+        if not stream:
+            response = self.llm.generate_content(prompt)
+            self.timer.record("llm", time.perf_counter() - t0)
+            return response
+        return self._stream(self.llm.generate_content(prompt, stream=True), t0)
+
+    def _stream(self, chunks, t0):
+        first = True
+        for chunk in chunks:
+            if first:
+                self.timer.record("llm_first_token", time.perf_counter() - t0)
+                first = False
+            yield chunk
+        self.timer.record("llm", time.perf_counter() - t0)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def replay(conversation, timer):
+    session = assistant.new_session()
+    history = []
+    for message in conversation["messages"]:
+        if message["role"] != "patient":
+            continue
+        session.add("Patient", message["content"])
+        history.append({"role": "Patient", "content": message["content"]})
+        t0 = time.perf_counter()
+        response = assistant.agent(message["content"], session)
+        timer.record("agent", time.perf_counter() - t0)
+        session.add("Assistant", response)
+        history.append({"role": "Assistant", "content": response})
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--conversations", type=int, default=100, help="number of conversations to replay")
+    parser.add_argument("--file", help="conversations.json in the notebook 01 format")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per stub LLM call")
+    parser.add_argument("--events-per-day", type=int, default=20)
+    parser.add_argument("--allocations", action="store_true", help="trace allocations (slower)")
+    parser.add_argument("--metrics", action="store_true", help="print tracing metrics and the slowest trace")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    if args.file:
+        with open(args.file) as f:
+            conversations = json.load(f)["conversations"][:args.conversations]
+    else:
+        conversations = synthetic_conversations(args.conversations, rng)
+
+    timer = StageTimer()
+    calendar = FakeCalendarService()
+    seed_calendar(calendar, args.events_per_day, rng)
+    llm = StubLLM(latency=args.llm_latency)
+    assistant.configure(EventCache(calendar, "bench", assistant.est), TimedLLM(llm, timer))
+    assistant.answer_cache = AnswerCache()
+    for name in ("retrieve", "get_available_slots", "parse_and_book", "book_appointment"):
+        setattr(assistant, name, timer.wrap(name, getattr(assistant, name)))
+
+    if args.allocations:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        histories = list(pool.map(lambda c: replay(c, timer), conversations))
+    elapsed = time.perf_counter() - t0
+
+    turns = sum(len(h) // 2 for h in histories)
+    bookings = sum(1 for h in histories for m in h if m["content"].count("Appointment booked"))
+    print(f"{len(conversations)} conversations, {turns} turns, concurrency {args.concurrency}, "
+          f"stub LLM {args.llm_latency * 1000:.0f} ms, {len(calendar.live_events())} calendar events")
+    print(f"throughput: {turns / elapsed:.1f} turns/s over {elapsed:.2f} s; "
+          f"{bookings} bookings, {llm.calls} LLM calls, {dict(calendar.requests)}")
+    print(f"answer cache: {assistant.answer_cache.stats()}")
+    # A reply written mid-conversation is never served to another patient
+    assistant.answer_cache.clear()
+    for opening in ("My name is Jane Doe", "Hi, my daughter Emma is 7"):
+        session = assistant.new_session()
+        session.add("Patient", opening)
+        session.add("Assistant", assistant.agent(opening, session))
+        session.add("Patient", "How much is a crown?")
+        assistant.agent("How much is a crown?", session)
+    hits = assistant.answer_cache.stats()["hits"]
+    session = assistant.new_session()
+    session.add("Patient", "How much is a crown?")
+    assistant.agent("How much is a crown?", session)
+    assert assistant.answer_cache.stats()["hits"] == hits
+    print(f"\n{'stage':<22} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage in ("agent", "retrieve", "get_available_slots", "llm_first_token", "llm",
+                  "parse_and_book", "book_appointment"):
+        values = timer.samples.get(stage)
+        if values:
+            print(f"{stage:<22} {len(values):>6} " + " ".join(
+                f"{percentile(values, q) * 1000:>8.2f}" for q in (50, 95, 99)))
+    sizes = timer.samples["prompt_chars"]
+    print(f"{'prompt chars':<22} {len(sizes):>6} " + " ".join(
+        f"{percentile(sizes, q):>8.0f}" for q in (50, 95, 99)))
+
+    if args.metrics:
+        print("\n" + tracing.tracer.metrics.render())
+        slowest = max(tracing.tracer.recent, key=lambda t: t.seconds)
+        print(json.dumps(slowest.to_dict(), indent=1, default=str))
+
+    if args.allocations:
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        print(f"\nallocations: peak {peak / 1024:.0f} KiB, retained {current / 1024:.0f} KiB "
+              f"({current / max(turns, 1):.0f} B/turn)")
+        for stat in after.compare_to(before, "lineno")[:5]:
+            print(f"  {stat}")
+
+
+if __name__ == "__main__":
+    main()
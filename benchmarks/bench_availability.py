@@ -0,0 +1,85 @@
+"""Benchmark the availability engine against the original nested-loop scan.
+
+Usage: python benchmarks/bench_availability.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from availability import WORK_DAYS, BusyTimeline, parse_busy_periods
+
+est = pytz.timezone('US/Eastern')
+OPEN = datetime.min.time().replace(hour=7, minute=30)
+CLOSE = datetime.min.time().replace(hour=18, minute=30)
+
+
+def reference_slots(busy_periods, now, days_ahead, duration_minutes):
+    # The get_available_slots loop as it shipped before the engine
+    available = []
+    current_day = now.date()
+    for day_offset in range(days_ahead):
+        check_date = current_day + timedelta(days=day_offset)
+        if check_date.weekday() not in WORK_DAYS:
+            continue
+        slot_time = est.localize(datetime.combine(check_date, OPEN))
+        end_time = est.localize(datetime.combine(check_date, CLOSE))
+        while slot_time + timedelta(minutes=duration_minutes) <= end_time:
+            if slot_time > now:
+                is_available = True
+                slot_end = slot_time + timedelta(minutes=duration_minutes)
+                for busy_start, busy_end in busy_periods:
+                    if slot_time < busy_end and slot_end > busy_start:
+                        is_available = False
+                        break
+                if is_available:
+                    available.append(slot_time)
+            slot_time += timedelta(minutes=15)
+    return available
+
+
+def synthetic_events(now, days_ahead, n_events, rng):
+    events = []
+    for _ in range(n_events):
+        day = now.date() + timedelta(days=rng.randrange(days_ahead))
+        if rng.random() < 0.02:
+            events.append({'start': {'date': day.isoformat()}, 'end': {'date': (day + timedelta(days=1)).isoformat()}})
+            continue
+        start = est.localize(datetime.combine(day, datetime.min.time())) + timedelta(minutes=rng.randrange(6 * 60, 19 * 60, 5))
+        end = start + timedelta(minutes=rng.choice([0, 10, 30, 45, 60, 90]))
+        events.append({'start': {'dateTime': start.isoformat()}, 'end': {'dateTime': end.isoformat()}})
+    return events
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    rng = random.Random(7)
+    now = est.localize(datetime(2025, 12, 15, 9, 7))
+    print(f"{'events':>7} {'days':>5} {'dur':>4} {'slots':>6} {'reference ms':>13} {'engine ms':>10} {'speedup':>8}")
+    for days_ahead in (7, 21, 60):
+        for n_events in (10, 100, 500, 2000):
+            busy = parse_busy_periods(synthetic_events(now, days_ahead, n_events, rng), est)
+            for duration in (30, 45, 90):
+                ref_time, expected = timed(lambda: reference_slots(busy, now, days_ahead, duration), 1)
+                new_time, got = timed(lambda: BusyTimeline(busy).free_slots(
+                    now.date(), days_ahead, OPEN, CLOSE, duration, now, est), 5)
+                assert got == expected, (n_events, days_ahead, duration)
+                print(f"{n_events:>7} {days_ahead:>5} {duration:>4} {len(got):>6} "
+                      f"{ref_time * 1000:>13.2f} {new_time * 1000:>10.2f} {ref_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
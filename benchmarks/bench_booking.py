@@ -0,0 +1,153 @@
+"""Concurrent booking check: no slot may be booked twice.
+
+Many threads race to book the same few openings on a fake Calendar whose
+requests take LATENCY seconds, which leaves the same window between the
+availability check and the insert that a real network does. The old path
+(list openings, then insert) is run first to show the race; then the same
+load goes through Scheduler.book (re-verify plus hold) and through
+assistant.parse_and_book, and both must produce zero overlapping bookings.
+
+Usage: python benchmarks/bench_booking.py
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+import assistant
+from fakes import FakeFreeBusyService, FakeHttpError, StubLLM
+from reservations import SlotTaken
+from scheduler import FreeBusyCache
+
+LATENCY = 0.01
+THREADS = 32
+ATTEMPTS = 256
+LOCATION_CALENDARS = {"Christiana": ["christiana-1", "christiana-2"], "Newport": ["newport-1"]}
+
+
+def next_workday(now):
+    day = now.date() + timedelta(days=1)
+    while day.weekday() > 3:
+        day += timedelta(days=1)
+    return day
+
+
+def double_bookings(service):
+    # Bookings on the same calendar whose times overlap
+    overlaps = 0
+    for calendar in service.calendars.values():
+        booked = sorted(calendar.bounds[e['id']] for e in calendar.live_events() if ' - ' in e['summary'])
+        overlaps += sum(1 for (_, end), (start, _) in zip(booked, booked[1:]) if start < end)
+    return overlaps
+
+
+def body(slot, duration, name):
+    return {'summary': f'Cleaning - {name}',
+            'start': {'dateTime': slot.isoformat()},
+            'end': {'dateTime': (slot + timedelta(minutes=duration)).isoformat()}}
+
+
+def setup():
+    calendar_ids = [c for ids in LOCATION_CALENDARS.values() for c in ids]
+    service = FakeFreeBusyService(calendar_ids, latency=LATENCY)
+    cache = FreeBusyCache(service, calendar_ids, assistant.est, max_staleness=3600)
+    assistant.configure(cache, StubLLM(latency=0), location_calendars=LOCATION_CALENDARS)
+    return service, cache
+
+
+def unsafe_book(cache, slots, i):
+    # What parse_and_book used to do: list every opening, then insert
+    slot = slots[i % len(slots)]
+    if slot in assistant.get_available_slots("Newport", duration_minutes=45)["Newport"]:
+        cache.insert(body(slot, 45, f"Patient {i}"), LOCATION_CALENDARS["Newport"][0])
+        return True
+    return False
+
+
+def safe_book(slots, i):
+    slot = slots[i % len(slots)]
+    try:
+        assistant.scheduler.book(slot, "Newport", 45, body(slot, 45, f"Patient {i}"))
+        return True
+    except SlotTaken:
+        return False
+
+
+def agent_book(day, i):
+    # What the agent does with a confirmed BOOKED: line; everyone wants 9:00
+    line = f"BOOKED: Patient Number{i}, Cleaning, Christiana, {day.strftime('%A, %b %d, %Y')} at 09:00 AM"
+    return "Appointment booked" in assistant.parse_and_book(f"You're all set!\n{line}")
+
+
+def run(name, service, fn):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        booked = sum(pool.map(fn, range(ATTEMPTS)))
+    elapsed = time.perf_counter() - t0
+    overlaps = double_bookings(service)
+    print(f"{name:<28} {booked:>7} {overlaps:>15} {elapsed * 1000:>9.0f}")
+    return overlaps
+
+
+def main():
+    now = datetime.now(assistant.est)
+    day = next_workday(now)
+    print(f"{THREADS} threads, {ATTEMPTS} attempts, {LATENCY * 1000:.0f} ms per Calendar request")
+    print(f"{'path':<28} {'booked':>7} {'double-booked':>15} {'ms':>9}")
+
+    service, cache = setup()
+    slots = list(assistant.scheduler.day_openings(day, 45, "Newport"))[:8]
+    run("check then insert (old)", service, lambda i: unsafe_book(cache, slots, i))
+
+    service, cache = setup()
+    assert run("Scheduler.book", service, lambda i: safe_book(slots, i)) == 0
+
+    service, cache = setup()
+    assert run("parse_and_book", service, lambda i: agent_book(day, i)) == 0
+
+    # A Calendar failure is reported to the patient, never passed off as a confirmation
+    service, cache = setup()
+
+    def failing_insert(calendarId, body):
+        raise FakeHttpError(503)
+
+    service.insert = failing_insert
+    reply = assistant.parse_and_book(f"You're all set!\nBOOKED: Jane Doe, Cleaning, Christiana, "
+                                     f"{day.strftime('%A, %b %d, %Y')} at 09:00 AM")
+    assert "BOOKED:" not in reply and "couldn't complete the booking" in reply, reply
+
+    # No time in the line: ask for one rather than book the day's first opening
+    service, cache = setup()
+    line = f"BOOKED: Jane Doe, Cleaning, Christiana, {day.strftime('%A, %b %d, %Y')}"
+    reply = assistant.parse_and_book(f"You're all set!\n{line}")
+    assert "What time" in reply and service.requests['events.insert'] == 0, reply
+    # A 24-hour time between openings books the nearest one and says so
+    reply = assistant.parse_and_book(f"You're all set!\n{line} at 14:40")
+    assert "Appointment booked" in reply and "02:45 PM (adjusted to fit schedule)" in reply, reply
+
+    # Day-first, ISO and day-of-month dates book too; a line with no day asks for one, never shows BOOKED
+    for when in [day.strftime("%d %B %Y at 10:00 AM"), day.strftime("%Y-%m-%d 10:15"),
+                 f"the {day.day}th at 10:30 AM"]:
+        reply = assistant.parse_and_book(f"You're all set!\nBOOKED: Jane Doe, Cleaning, Christiana, {when}")
+        assert "Appointment booked" in reply and day.strftime("%b %d") in reply, (when, reply)
+    reply = assistant.parse_and_book("You're all set!\nBOOKED: Jane Doe, Cleaning, Christiana, soon at 9 AM")
+    assert "BOOKED:" not in reply and "Which day" in reply, reply
+
+    # Exact-time lookup: one day's openings keyed by start vs scanning 21 days of slots
+    target = assistant.est.localize(datetime.combine(day, datetime.min.time().replace(hour=15)))
+    t0 = time.perf_counter()
+    for _ in range(200):
+        [s for s in assistant.get_available_slots("Christiana", duration_minutes=45)["Christiana"] if s == target]
+    scan = (time.perf_counter() - t0) / 200
+    t0 = time.perf_counter()
+    for _ in range(200):
+        target in assistant.scheduler.day_openings(day, 45, "Christiana")
+    lookup = (time.perf_counter() - t0) / 200
+    print(f"\nslot lookup: {scan * 1e6:.0f} us scanning all slots, {lookup * 1e6:.0f} us with the day index")
+
+
+if __name__ == "__main__":
+    main()
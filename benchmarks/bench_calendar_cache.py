@@ -0,0 +1,118 @@
+"""Replay chat turns against the shared event cache and a fake Calendar.
+
+Every turn computes availability twice: once through EventCache and once from
+a fresh full listing, and the two must agree. External edits, cancellations,
+bookings and an expired sync token are mixed in along the way. The script
+prints how many Calendar requests each approach needed.
+
+Usage: python benchmarks/bench_calendar_cache.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from availability import BusyTimeline, parse_busy_periods
+from calendar_cache import EventCache
+from fakes import FakeCalendarService
+
+est = pytz.timezone('US/Eastern')
+OPEN = datetime.min.time().replace(hour=8)
+CLOSE = datetime.min.time().replace(hour=17)
+DAYS_AHEAD = 21
+
+
+def uncached_slots(service, now, duration):
+    # What get_available_slots did before the cache: one full listing per call
+    events = []
+    page_token = None
+    while True:
+        result = service.events().list(
+            calendarId='demo', timeMin=now.isoformat(),
+            timeMax=(now + timedelta(days=DAYS_AHEAD)).isoformat(),
+            singleEvents=True, orderBy='startTime', pageToken=page_token).execute()
+        events += result.get('items', [])
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            break
+    return BusyTimeline(parse_busy_periods(events, est)).free_slots(
+        now.date(), DAYS_AHEAD, OPEN, CLOSE, duration, now, est)
+
+
+def random_event(service, now, rng):
+    day = now.date() + timedelta(days=rng.randrange(DAYS_AHEAD))
+    start = est.localize(datetime.combine(day, OPEN)) + timedelta(minutes=15 * rng.randrange(36))
+    return service.add_event(start, start + timedelta(minutes=rng.choice([30, 45, 60, 90])))
+
+
+def main(turns=200, initial_events=300):
+    rng = random.Random(11)
+    now = datetime.now(est)
+    service = FakeCalendarService(page_size=100)
+    for _ in range(initial_events):
+        random_event(service, now, rng)
+
+    # max_staleness=0 forces a sync every turn so the check is exact; the
+    # requests still shrink to one small incremental listing.
+    cache = EventCache(service, 'demo', est, max_staleness=0)
+    cached_time = uncached_time = 0.0
+    cached_requests = uncached_requests = 0
+    for turn in range(turns):
+        roll = rng.random()
+        if roll < 0.15:
+            random_event(service, now, rng)
+        elif roll < 0.25 and service.live_events():
+            service.cancel_event(rng.choice(service.live_events())['id'])
+        elif roll < 0.30:
+            day = now.date() + timedelta(days=rng.randrange(DAYS_AHEAD))
+            start = est.localize(datetime.combine(day, OPEN)) + timedelta(minutes=15 * rng.randrange(36))
+            cache.insert({'start': {'dateTime': start.isoformat()},
+                          'end': {'dateTime': (start + timedelta(minutes=45)).isoformat()}})
+        if turn == turns // 2:
+            service.expire_sync_tokens()
+
+        duration = rng.choice([30, 45, 60, 90])
+        before = service.requests['events.list']
+        t0 = time.perf_counter()
+        got = cache.timeline().free_slots(now.date(), DAYS_AHEAD, OPEN, CLOSE, duration, now, est)
+        cached_time += time.perf_counter() - t0
+        cached_requests += service.requests['events.list'] - before
+
+        before = service.requests['events.list']
+        t0 = time.perf_counter()
+        expected = uncached_slots(service, now, duration)
+        uncached_time += time.perf_counter() - t0
+        uncached_requests += service.requests['events.list'] - before
+
+        assert got == expected, f"cache diverged on turn {turn}"
+
+    # Events past the window are not listed, nor kept when a sync token reports them
+    far = est.localize(datetime.combine(now.date() + timedelta(days=90), OPEN))
+    far_event = service.add_event(far, far + timedelta(hours=1))
+    cache.refresh(0)
+    assert far_event['id'] not in cache.busy_periods
+    assert all(start < cache.window_end for start, _ in cache.busy_periods.values())
+    fresh = EventCache(service, 'demo', est)
+    fresh.refresh()
+    assert far_event['id'] not in fresh.busy_periods
+
+    print(f"turns: {turns}, live events at end: {len(service.live_events())}")
+    print(f"full listing per turn: {uncached_requests} list requests, {uncached_time * 1000:.0f} ms")
+    print(f"event cache:           {cached_requests} list requests, {cached_time * 1000:.0f} ms "
+          f"({cache.full_syncs} full syncs, {cache.incremental_syncs} incremental)")
+
+    # With the default staleness bound most turns never reach the API at all
+    service.requests.clear()
+    cache.max_staleness = 60
+    for _ in range(turns):
+        cache.timeline()
+    print(f"staleness bound 60s:   {service.requests['events.list']} list requests for {turns} turns")
+
+
+if __name__ == "__main__":
+    main()
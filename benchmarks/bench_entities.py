@@ -0,0 +1,227 @@
+"""Entity extraction: the separate per-fact scans vs one EntityExtractor pass.
+
+Before the extractor, each fact had its own pass over a message: a
+substring loop per service and location, the date, part-of-day,
+scheduling and name regexes, and the retrieval tokenizer. BOOKED lines
+were split by hand and parsed with dateutil's fuzzy parser. This bench
+keeps those implementations as they shipped. On a generated corpus of
+patient and assistant messages it checks that both derive the same
+service, location, dates, part of day, scheduling intent, name and BM25
+terms, and that both parse the same booking from BOOKED lines. It then
+times a turn's worth of each on transcripts of growing length: the fact
+scans over the new message plus BM25 terms for the last six messages,
+which retrieval used to re-tokenize every turn and now takes from the
+keywords each message was extracted with.
+
+Usage: python benchmarks/bench_entities.py
+"""
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from dateutil import parser as date_parser
+
+import assistant
+from entities import MONTH_NUMBERS, PARTS_OF_DAY, WEEKDAY_NAMES, resolve_dates
+from retrieval import tokenize
+
+DATE_RE = re.compile(
+    r"\b(?:(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+(\d{1,2})(?:st|nd|rd|th)?"
+    r"|(\d{1,2})/(\d{1,2}))\b"
+    r"|\b(" + "|".join(WEEKDAY_NAMES) + r")s?\b"
+    r"|\b(today|tomorrow|this week|next week)\b")
+PART_OF_DAY_RE = re.compile(r"\b(" + "|".join(PARTS_OF_DAY) + r")s?\b")
+SCHEDULING_RE = re.compile(
+    r"\b(schedul\w*|book\w*|appointments?|appts?|availab\w*|openings?|slots?|come in|fit me in|"
+    r"reschedul\w*|sooner|earliest|\d{1,2}(:\d{2})?\s*(am|pm)|confirm\w*)\b")
+NAME_RE = re.compile(r"\b(?i:my name is|name's|this is|i am|i'm)\s+([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)+)")
+
+EXTRACTOR = assistant.knowledge.current().extractor
+SERVICES = list(assistant.SERVICE_DURATIONS) + ["cleanings", "fillings", "crowns", "implants", "root canals"]
+DATES = ["Monday", "tuesday", "Wednesdays", "thursday", "Friday", "today", "tomorrow", "this week", "next week",
+         "Dec 16th", "december 3", "Jan. 5", "11/20", "3/14", "Feb 30"]
+TIMES = ["8am", "10:30 am", "2 PM", "4:15pm", "noon"]
+PARTS = ["morning", "afternoon", "evenings", "lunch"]
+PEOPLE = ["Sarah Johnson", "Mike O'Brien", "Priya Patel", "Luis Garcia-Lopez"]
+TEMPLATES = [
+    "Hi, I need a {service} at {location}",
+    "Can I come in {date} {part} for {service}?",
+    "Do you have anything {date} around {time}? {location} is closer for me",
+    "My name is {person}, I'd like to book {service}",
+    "i'm {person} and I was seeing Dr. Adeline about {service}",
+    "I'm good thanks, is {date} at {time} still available at {location}?",
+    "Actually {date} works better, earliest slot please",
+    "How much is {service}? Does Delta Dental cover it?",
+    "What are your hours on {date}?",
+    "This is {person}. Any openings with Dr. Wilson {date}?",
+    "Great, that works. See you then!",
+]
+
+
+def old_scans(text, today):
+    # What agent() and Session.add computed, one scan per fact
+    lower = text.lower()
+    service = next((s for s in assistant.SERVICE_DURATIONS if s in lower), None)
+    location = "Christiana" if "christiana" in lower else "Newport" if "newport" in lower else None
+    dates = old_dates_in(lower, today, 21)
+    hours = PART_OF_DAY_RE.search(lower)
+    hours = PARTS_OF_DAY[hours.group(1)] if hours else None
+    scheduling = bool(SCHEDULING_RE.search(lower) or DATE_RE.search(lower) or hours)
+    name = NAME_RE.search(text)
+    return service, location, dates, hours, scheduling, name.group(1) if name else None
+
+
+def old_facts(text, today):
+    return old_scans(text, today) + (tokenize(text),)
+
+
+def old_dates_in(text, today, days_ahead):
+    dates = set()
+    for month_name, day, month_num, day_num, weekday, relative in DATE_RE.findall(text):
+        try:
+            if month_name or month_num:
+                month = MONTH_NUMBERS[month_name] if month_name else int(month_num)
+                target = today.replace(month=month, day=int(day or day_num))
+                if target < today:
+                    target = target.replace(year=today.year + 1)
+                dates.add(target)
+            elif weekday:
+                offset = (WEEKDAY_NAMES.index(weekday) - today.weekday()) % 7
+                dates.update(today + timedelta(days=d) for d in range(offset, days_ahead, 7))
+            elif relative == "today":
+                dates.add(today)
+            elif relative == "tomorrow":
+                dates.add(today + timedelta(days=1))
+            else:
+                monday = today - timedelta(days=today.weekday())
+                if relative == "next week":
+                    monday += timedelta(days=7)
+                dates.update(monday + timedelta(days=d) for d in range(7))
+        except ValueError:
+            continue
+    return dates
+
+
+def new_facts(text, today):
+    found = EXTRACTOR.extract(text)
+    return (found.services[0] if found.services else None, found.locations[0] if found.locations else None,
+            resolve_dates(found.dates, today), found.hours, found.scheduling, found.patient_name, found.keywords)
+
+
+def old_booking(response_text):
+    # parse_and_book's parsing as it shipped
+    book_line = [l for l in response_text.split('\n') if 'BOOKED:' in l][0]
+    parts = book_line.replace('BOOKED:', '').strip().split(', ')
+    target = date_parser.parse(', '.join(parts[3:]).strip(), fuzzy=True)
+    return parts[0].strip(), parts[1].strip(), parts[2].strip(), target.date(), (target.hour, target.minute)
+
+
+def new_booking(response_text, today):
+    booking = EXTRACTOR.booking(response_text, today)
+    return booking.name, booking.service, booking.location, booking.day, booking.time
+
+
+def message(rng):
+    if rng.random() < 0.2:
+        return rng.choice(assistant.RAG_CHUNKS)
+    return rng.choice(TEMPLATES).format(service=rng.choice(SERVICES), location=rng.choice(["Christiana", "Newport"]),
+                                        date=rng.choice(DATES), time=rng.choice(TIMES), part=rng.choice(PARTS),
+                                        person=rng.choice(PEOPLE))
+
+
+def booked_line(rng, now):
+    slot = now.replace(hour=rng.randrange(8, 18), minute=rng.choice([0, 15, 30, 45])) + timedelta(days=rng.randrange(21))
+    clock = slot.strftime('%I:%M %p') if rng.random() < 0.5 else slot.strftime('%I:%M %p').lstrip('0')
+    return (f"You're all set!\nBOOKED: {rng.choice(PEOPLE)}, {rng.choice(SERVICES).title()}, "
+            f"{rng.choice(['Christiana', 'Newport'])}, {slot.strftime('%A, %b %d, %Y')} at {clock}\nSee you then.")
+
+
+def old_turns(transcript, today):
+    recent = deque(maxlen=6)
+    for text in transcript:
+        old_scans(text, today)
+        recent.append(text)
+        set(tokenize(text + " " + " ".join(recent)))
+
+
+def new_turns(transcript, today):
+    recent = deque(maxlen=6)
+    for text in transcript:
+        found = EXTRACTOR.extract(text)
+        resolve_dates(found.dates, today)
+        recent.append(found.keywords)
+        set(keyword for keywords in recent for keyword in keywords)
+
+
+def timed(fn, items, *args):
+    t0 = time.perf_counter()
+    for item in items:
+        fn(item, *args)
+    return time.perf_counter() - t0
+
+
+def main():
+    rng = random.Random(8)
+    now = datetime.now(assistant.est)
+    today = now.date()
+
+    corpus = [message(rng) for _ in range(5000)]
+    for text in corpus:
+        expected = old_facts(text, today)
+        # The old scan took the first table entry inside the text: "consultation" out of "braces consultation"
+        if 0 < text.lower().count("braces consultation") == text.lower().count("consultation"):
+            expected = ("braces consultation",) + expected[1:]
+        assert expected == new_facts(text, today), text
+    print(f"facts match on {len(corpus)} messages")
+
+    lines = [booked_line(rng, now) for _ in range(1000)]
+    for text in lines:
+        assert old_booking(text) == new_booking(text, today), text
+    print(f"bookings match on {len(lines)} BOOKED lines")
+
+    # Only real month names make a date: the old pattern read "decided 2" as Dec 2
+    for text in ["I decided 2 weeks ago", "Marathon 5 was fun", "The mayor 4 years ago", "Augusta 3"]:
+        found = EXTRACTOR.extract(text)
+        assert not found.dates and not found.scheduling, text
+    for text, month_day in [("Sept 5", (9, 5)), ("September 5th", (9, 5)), ("sep. 3", (9, 3)), ("June 1", (6, 1))]:
+        assert EXTRACTOR.extract(text).dates[0][1:3] == month_day, text
+
+    # Times dateutil read that the am/pm pattern alone did not; no time at all is None, never midnight
+    prefix = "BOOKED: Jane Doe, Cleaning, Newport, Tuesday, Oct 20, 2026 at "
+    for written, clock in [("14:30", (14, 30)), ("noon", (12, 0)), ("2:30", (14, 30)), ("9", (9, 0)),
+                           ("07:45", (7, 45)), ("2 p.m.", (14, 0)), ("9:15am", (9, 15)), ("midnight", (0, 0))]:
+        assert EXTRACTOR.booking(prefix + written, today).time == clock, written
+    assert EXTRACTOR.booking("BOOKED: Jane Doe, Cleaning, Newport, Tuesday, Oct 20, 2026", today).time is None
+
+    # Day-first, ISO and day-of-month-only dates, as the model also writes them
+    prefix = "BOOKED: Jane Doe, Cleaning, Newport, "
+    fixed = date(2025, 12, 1)
+    for written in ["16 December 2025 at 8:00 AM", "2025-12-16 08:00", "the 16th at 8 AM", "Tuesday, the 16th at 8 AM",
+                    "16th of Dec at 8am"]:
+        booking = EXTRACTOR.booking(prefix + written, fixed)
+        assert (booking.day, booking.time) == (date(2025, 12, 16), (8, 0)), written
+    assert EXTRACTOR.booking(prefix + "the 31st at 9am", date(2025, 11, 5)).day == date(2025, 12, 31)
+
+    print(f"\n{'messages':>8} {'old us/msg':>11} {'new us/msg':>11} {'old us/turn':>12} {'new us/turn':>12} {'speedup':>8}")
+    for turns in (10, 100, 1000, 10000):
+        transcript = [message(rng) for _ in range(turns)]
+        old = min(timed(old_facts, transcript, today) for _ in range(3)) / turns
+        new = min(timed(new_facts, transcript, today) for _ in range(3)) / turns
+        old_turn = min(timed(old_turns, [transcript], today) for _ in range(3)) / turns
+        new_turn = min(timed(new_turns, [transcript], today) for _ in range(3)) / turns
+        print(f"{turns:>8} {old * 1e6:>11.1f} {new * 1e6:>11.1f} {old_turn * 1e6:>12.1f} {new_turn * 1e6:>12.1f} "
+              f"{old_turn / new_turn:>7.1f}x")
+
+    old = timed(old_booking, lines)
+    new = timed(new_booking, lines, today)
+    print(f"\nBOOKED line: {old / len(lines) * 1e6:.0f} us with dateutil, {new / len(lines) * 1e6:.0f} us extracted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Knowledge-base snapshot: startup cost and hot reload under load.
+
+Generates the notebook JSON sources (office_info, providers, services,
+faqs) at growing sizes, with services named as notebook 02 names them. For each size it times a compile from JSON
+(parse, chunk, build the BM25 index) against a KnowledgeBase start with
+a current snapshot (hash the sources' bytes, load the snapshot in one
+read), and checks that the loaded snapshot searches identically.
+
+It then replays conversations through agent() on several threads while
+the sources are edited underneath. The edits are:
+- a later Christiana opening and a longer cleaning, written atomically;
+- a half-written services.json, which must be rejected while the old
+  snapshot keeps serving;
+- the fix.
+The checks:
+- short names ("implant", "whitening") get their service's duration;
+- no turn fails;
+- reloads and rejections are counted;
+- new turns see the new hours in the prompt, the availability views and
+  get_duration;
+- a conversation started before the reload extracts the new services;
+- a vector index built before the reload adds no stale or duplicate chunks.
+
+Usage: python benchmarks/bench_knowledge_base.py
+"""
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+import assistant
+from bench_agent import seed_calendar, synthetic_conversations
+from calendar_cache import EventCache
+from fakes import FakeCalendarService, StubLLM
+from knowledge_base import KnowledgeBase, compile_snapshot, describe_hours, read_sources, save_snapshot
+from tracing import Metrics
+from vector_index import HashingEncoder, VectorIndex, build_index
+
+# Services as notebook 02 lists them ("Dental Implant Placement", "Emergency Visit"), from the built-in chunks
+SERVICE_RE = re.compile(r"^(?P<name>[A-Z][\w ()'/-]+): (?P<description>.*?)\. Duration: (?P<minutes>\d+) minutes")
+NOTEBOOK_SERVICES = [m.groupdict() for m in map(SERVICE_RE.match, assistant.RAG_CHUNKS) if m]
+QUERIES = ["How much is a crown?", "Do you take Delta Dental?", "What are your hours in Newport?",
+           "Who does wisdom teeth extraction?", "Is there a cancellation fee?"]
+
+
+def sources(n_faqs, rng, christiana_open="7:30 AM", cleaning_minutes=45, night_guard=False):
+    office_info = {
+        "locations": [
+            {"name": "Avalon Dental Christiana", "address": "430 Christiana Medical Center", "city": "Newark",
+             "state": "DE", "zip": "19702", "phone": "302-292-8899",
+             "hours": {"Monday-Thursday": f"{christiana_open} - 6:30 PM", "Friday-Sunday": "Closed"}},
+            {"name": "Avalon Dental Newport", "address": "406 Larch Circle", "city": "Newport", "state": "DE",
+             "zip": "19804", "phone": "302-999-8822",
+             "hours": {"Monday-Thursday": "8:00 AM - 5:00 PM", "Friday-Sunday": "Closed"}},
+        ],
+        "contact": {"main_phone": "302-292-8899", "text_number": "302-300-4614", "email": "avalondentalde@gmail.com"},
+        "cancellation_policy": {"notice_required_days": 2},
+        "savings_plan": {"name": "Avalon Dental Savings Plan", "enrollment_fee": 60,
+                         "benefits": ["Exam, Cleaning and X-rays for $175", "15% off all dental services"],
+                         "terms": "No waiting periods and no annual maximums."},
+    }
+    providers = {"providers": [
+        {"id": "dr_parham_farhi", "name": "Dr. Parham Farhi", "credentials": "DDS",
+         "specialties": ["Cosmetic Dentistry", "Root Canals", "Implant Placement"], "bio": "Founder."},
+        {"id": "dr_adeline_farhi", "name": "Dr. Adeline Farhi", "credentials": "DDS",
+         "specialties": ["General Dentistry", "Children's Dentistry"], "bio": "Gentle with kids."},
+        {"id": "dr_james_wilson", "name": "Dr. James Wilson", "credentials": "DMD",
+         "specialties": ["Oral Surgery", "Wisdom Teeth Extraction"], "bio": "Complex surgical cases."},
+    ]}
+    services = {"services": [
+        {"id": re.sub(r"\W+", "_", re.sub(r"\s*\(.*?\)", "", s["name"]).lower()), "name": s["name"],
+         "description": s["description"],
+         "duration_minutes": cleaning_minutes if s["name"] == "Cleaning" else int(s["minutes"]),
+         "price_range": {"min": 100, "max": 100 + int(s["minutes"]) * 10}}
+        for s in NOTEBOOK_SERVICES if night_guard or s["name"] != "Night Guard"]}
+    sentences = [s for chunk in assistant.RAG_CHUNKS for s in chunk.split(". ")]
+    faqs = {"faqs": [{"question": f"Question {i} about {rng.choice(sentences)[:40]}?",
+                      "answer": " ".join(rng.sample(sentences, 3))} for i in range(n_faqs)]}
+    return {"office_info.json": office_info, "providers.json": providers, "services.json": services,
+            "faqs.json": faqs}
+
+
+def write_sources(data_dir, documents):
+    for name, document in documents.items():
+        tmp = os.path.join(data_dir, name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(document, f)
+        os.replace(tmp, os.path.join(data_dir, name))
+
+
+def startup(rng):
+    print(f"{'chunks':>7} {'compile ms':>11} {'start ms':>9} {'speedup':>8} {'snapshot KB':>12}")
+    for n_faqs in (30, 500, 5000):
+        with tempfile.TemporaryDirectory() as data_dir:
+            write_sources(data_dir, sources(n_faqs, rng))
+            path = os.path.join(data_dir, "knowledge.snapshot")
+            t0 = time.perf_counter()
+            compiled = compile_snapshot(*read_sources(data_dir))
+            compile_seconds = time.perf_counter() - t0
+            save_snapshot(compiled, path)
+            load_seconds = min(_timed(KnowledgeBase, data_dir, path) for _ in range(3))
+            loaded = KnowledgeBase(data_dir, path).snapshot
+            assert (loaded.ids, loaded.chunks, loaded.service_durations, loaded.service_aliases, loaded.locations,
+                    loaded.digest) == (compiled.ids, compiled.chunks, compiled.service_durations,
+                                       compiled.service_aliases, compiled.locations, compiled.digest)
+            for query in QUERIES:
+                assert loaded.index.search(query) == compiled.index.search(query)
+            print(f"{len(compiled.chunks):>7} {compile_seconds * 1000:>11.1f} {load_seconds * 1000:>9.1f} "
+                  f"{compile_seconds / load_seconds:>7.1f}x {os.path.getsize(path) / 1024:>12.0f}")
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def first_opening(location):
+    # Earliest opening on a working day past the booking window, so the load cannot have filled it
+    now = datetime.now(assistant.est)
+    day = next(d for d in (now.date() + timedelta(days=i) for i in range(28, 35)) if d.weekday() < 4)
+    return min(assistant.scheduler.day_openings(day, 30, location)).time()
+
+
+def hot_reload(rng):
+    data_dir = tempfile.mkdtemp()
+    # Same FAQs every time, so only the hours and the duration differ between versions
+    write_sources(data_dir, sources(30, random.Random(1)))
+    calendar = FakeCalendarService()
+    seed_calendar(calendar, 5, rng)
+    assistant.configure(EventCache(calendar, "bench", assistant.est), StubLLM(latency=0.02),
+                        knowledge_dir=data_dir, knowledge_snapshot=os.path.join(data_dir, "knowledge.snapshot"))
+    knowledge = assistant.knowledge
+    knowledge.check_interval = 0.01
+    knowledge.metrics = Metrics()
+    before = knowledge.current()
+    assert first_opening("Christiana").strftime("%H:%M") == "07:30"
+    # Short names patients use reach the notebook's full service names, not the 60-minute default
+    for said, minutes in [("implant", 90), ("emergency", 30), ("whitening", 60), ("a dental bridge", 90),
+                          ("scaling and root planing", 90), ("deep cleaning", 90)]:
+        assert assistant.get_duration(said) == minutes, said
+    deep = assistant.new_session()
+    deep.add("Patient", "Hi, I need a deep cleaning next week")
+    assert deep.service == "deep cleaning", deep.service
+    # Started before the reload, continued after it
+    ongoing = assistant.new_session()
+    ongoing.add("Patient", "Hi, are you open on Mondays?")
+
+    failures = []
+    turns = [0]
+    prompts_seen = set()
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def converse(conversation):
+        session = assistant.new_session()
+        for message in conversation["messages"]:
+            session.add("Patient", message["content"])
+            try:
+                reply = assistant.agent(message["content"], session)
+            except Exception as e:
+                with lock:
+                    failures.append(repr(e))
+                return
+            session.add("Assistant", reply)
+            with lock:
+                turns[0] += 1
+
+    def load():
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            while not stop.is_set():
+                list(pool.map(converse, synthetic_conversations(16, rng)))
+
+    def prompt_hours():
+        prompts_seen.add(describe_hours(knowledge.current().locations).splitlines()[0])
+
+    worker = threading.Thread(target=load)
+    worker.start()
+    time.sleep(0.5)
+    prompt_hours()
+    write_sources(data_dir, sources(30, random.Random(1), christiana_open="9:00 AM", cleaning_minutes=60,
+                                      night_guard=True))
+    time.sleep(0.5)
+    prompt_hours()
+    # A half-written file, as an editor without atomic saves would leave it
+    with open(os.path.join(data_dir, "services.json"), "w") as f:
+        f.write('{"services": [{"id": "cleaning", "na')
+    time.sleep(0.5)
+    rejected = knowledge.last_error
+    prompt_hours()
+    write_sources(data_dir, sources(30, random.Random(1), christiana_open="9:00 AM", cleaning_minutes=60,
+                                      night_guard=True))
+    time.sleep(0.5)
+    stop.set()
+    worker.join()
+
+    counters = {dict(labels)["outcome"]: value for (name, labels), value in knowledge.metrics.counters.items()
+                if name == "kb_reloads_total"}
+    print(f"\nhot reload: {turns[0]} turns on 8 threads, {len(failures)} failed; reloads {counters}; "
+          f"rejected: {rejected}")
+    for line in sorted(prompts_seen):
+        print(f"  prompt: {line}")
+    print(f"  Christiana first opening {first_opening('Christiana')}, cleaning {assistant.get_duration('cleaning')} min")
+    assert not failures, failures[:3]
+    # The fix restores the sources already loaded, so it swaps in an identical snapshot and is not a reload
+    assert knowledge.reloads == 1 and counters.get("ok") == 1 and counters.get("unchanged") == 1
+    assert counters.get("error", 0) >= 1 and rejected is not None
+    assert knowledge.last_error is None
+    assert first_opening("Christiana").strftime("%H:%M") == "09:00"
+    assert assistant.get_duration("cleaning") == 60
+    assert len(prompts_seen) == 2
+    ongoing.add("Patient", "Actually I need a night guard")
+    assert ongoing.service == "night guard" and assistant.get_duration(ongoing.service) == 30
+
+    # A vector index built before the reload, with a chunk since removed: each hit once, as the snapshot has it
+    index_dir = os.path.join(data_dir, "vectors")
+    build_index([{"id": i, "text": t} for i, t in zip(before.ids, before.chunks)]
+                + [{"id": "retired", "text": "A cleaning takes 45 minutes."}], HashingEncoder(), index_dir)
+    assistant.vector_index = VectorIndex(index_dir)
+    kb = knowledge.current()
+    hits = assistant.retrieve("How long does a cleaning take?", kb=kb)
+    assistant.vector_index = None
+    assert len({chunk_id for chunk_id, _ in hits}) == len(hits) and "retired" not in dict(hits)
+    assert all(text == kb.chunks[kb.rows[chunk_id]] for chunk_id, text in hits)
+    assert any("Duration: 60 minutes" in text for _, text in hits)
+
+
+def main():
+    rng = random.Random(9)
+    startup(rng)
+    hot_reload(rng)
+
+
+if __name__ == "__main__":
+    main()
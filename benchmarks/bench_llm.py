@@ -0,0 +1,117 @@
+"""LLMClient under a burst against a stub model with injected faults.
+
+The same burst of concurrent prompts goes to StubLLM directly and through
+LLMClient with a few settings. The stub fails a share of requests with a
+429 quota error and stalls a share before their first token. The bench
+reports:
+- failed calls;
+- latency percentiles;
+- upstream requests and peak upstream concurrency.
+
+It then checks three things:
+- the concurrency cap is never exceeded;
+- the rate limit holds;
+- identical prompts sent together reach the model once.
+
+Usage: python benchmarks/bench_llm.py --calls 200
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from bench_agent import percentile
+from fakes import StubLLM
+from llm_client import LLMClient
+from tracing import Metrics
+
+
+def call(llm, prompt):
+    t0 = time.perf_counter()
+    try:
+        text = "".join(chunk.text for chunk in llm.generate_content(prompt, stream=True))
+        return time.perf_counter() - t0, bool(text)
+    except Exception:
+        return time.perf_counter() - t0, False
+
+
+def burst(llm, prompts, threads):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda p: call(llm, p), prompts))
+    return results, time.perf_counter() - t0
+
+
+def report(name, stub, results, elapsed):
+    latencies = [seconds for seconds, _ in results]
+    failed = sum(1 for _, ok in results if not ok)
+    print(f"{name:<30} {failed:>6} " + " ".join(f"{percentile(latencies, q) * 1000:>7.0f}" for q in (50, 95, 99))
+          + f" {stub.calls:>9} {stub.peak:>5} {elapsed:>7.2f}")
+    return failed
+
+
+def stub(args, seed):
+    return StubLLM(latency=args.latency, failure_rate=args.failure_rate, slow_rate=args.slow_rate,
+                   slow_latency=args.slow_latency, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=64, help="concurrent callers")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    prompts = [f"Conversation:\nPatient: question number {i}" for i in range(args.calls)]
+    print(f"{args.calls} calls from {args.threads} threads; stub {args.latency * 1000:.0f} ms, "
+          f"{args.failure_rate:.0%} quota errors, {args.slow_rate:.0%} stall {args.slow_latency:.1f} s")
+    print(f"{'path':<30} {'failed':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'upstream':>9} {'peak':>5} {'s':>7}")
+
+    model = stub(args, 1)
+    report("direct", model, *burst(model, prompts, args.threads))
+
+    model = stub(args, 1)
+    client = LLMClient(model, max_concurrency=args.concurrency, backoff=0.05, metrics=Metrics())
+    failed = report(f"client, {args.concurrency} in flight", model, *burst(client, prompts, args.threads))
+    assert model.peak <= args.concurrency and failed == 0
+
+    # Hedging only uses spare slots, so it pays off below the cap
+    light = args.concurrency // 2
+    print(f"\n{light} concurrent callers (below the cap)")
+    model = stub(args, 2)
+    report("client", model, *burst(LLMClient(model, max_concurrency=args.concurrency, backoff=0.05,
+                                             metrics=Metrics()), prompts, light))
+    model = stub(args, 2)
+    client = LLMClient(model, max_concurrency=args.concurrency, backoff=0.05, hedge_after=args.latency * 2,
+                       metrics=Metrics())
+    failed = report("client + hedge", model, *burst(client, prompts, light))
+    assert model.peak <= args.concurrency and failed == 0
+    print("\n" + "\n".join(line for line in client.metrics.render().splitlines() if line.startswith("llm_")
+                            and "_total" in line) + "\n")
+
+    # Rate limit: no faults, instant model, 20 requests/s with bursts of 5
+    model = StubLLM(latency=0)
+    client = LLMClient(model, rate=20, burst=5, metrics=Metrics())
+    _, elapsed = burst(client, prompts[:45], args.threads)
+    print(f"rate limit 20/s, burst 5: 45 calls in {elapsed:.2f} s")
+    assert elapsed >= (45 - 5) / 20 * 0.95
+
+    # Coalescing: every prompt sent 4 times at once reaches the model once
+    model = StubLLM(latency=args.latency)
+    client = LLMClient(model, max_concurrency=args.concurrency, metrics=Metrics())
+    duplicated = [p for p in prompts[:50] for _ in range(4)]
+    results, _ = burst(client, duplicated, len(duplicated))
+    coalesced = client.metrics.counters[("llm_coalesced_total", ())]
+    print(f"coalescing: {len(duplicated)} calls, {model.calls} upstream, {coalesced} coalesced")
+    assert all(ok for _, ok in results) and model.calls == 50
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark get_context: substring scan vs the BM25 inverted index.
+
+Knowledge bases from 45 to 5000 synthetic chunks, then the shipped 45
+chunks, are queried with conversations of growing length. "index us"
+tokenizes the query and history on every call; "terms us" is what
+retrieve() does now: a search over the keywords each message was
+extracted with when it arrived, for the last six messages. At 45
+chunks, re-tokenizing a long history makes the index no faster than the
+substring scan (slower on the synthetic corpus); it pays off there only
+with the precomputed terms, and on its own from a few hundred chunks.
+
+Usage: python benchmarks/bench_retrieval.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from assistant import RAG_CHUNKS
+from retrieval import STOP_WORDS, InvertedIndex, tokenize
+
+VOCABULARY = (
+    "cleaning exam filling crown root canal extraction whitening emergency consultation implant "
+    "braces aligners veneers bonding bridge dentures sedation nitrous x-rays insurance delta dental "
+    "cigna metlife aetna guardian medicaid savings plan enrollment cost price payment carecredit "
+    "financing cancellation notice fee hours monday tuesday wednesday thursday christiana newport "
+    "newark location phone text email provider hygienist surgery wisdom teeth children pediatric "
+    "gentle anxious patients visit appointment minutes duration treatment gum disease periodontal"
+).split()
+
+
+def reference_context(chunks, query, conversation_history):
+    # get_context as it shipped before the index
+    full_text = query.lower() + " " + " ".join([m["content"].lower() for m in conversation_history])
+    words = [w for w in full_text.split() if w not in STOP_WORDS and len(w) > 2]
+    relevant = []
+    for chunk in chunks:
+        chunk_lower = chunk.lower()
+        if any(word in chunk_lower for word in words):
+            relevant.append(chunk)
+    return "\n".join(relevant[:10]) if relevant else "\n".join(chunks[:5])
+
+
+def terms_context(chunks, index, terms):
+    hits = index.search_terms(terms, k=10)
+    return "\n".join([chunks[chunk_id] for chunk_id, _ in hits]) if hits else "\n".join(chunks[:5])
+
+
+def indexed_context(chunks, index, query, conversation_history):
+    full_text = query + " " + " ".join([m["content"] for m in conversation_history])
+    hits = index.search(full_text, k=10)
+    return "\n".join([chunks[chunk_id] for chunk_id, _ in hits]) if hits else "\n".join(chunks[:5])
+
+
+# Real knowledge bases follow a Zipf-like word distribution: a few common
+# words and a long tail of names, procedures and prices.
+WORDS = VOCABULARY + [f"term{i}" for i in range(20000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(WORDS))]
+
+
+def sample_words(n, rng):
+    return rng.choices(WORDS, weights=WEIGHTS, k=n)
+
+
+def synthetic_chunks(n, rng):
+    return [" ".join(sample_words(rng.randint(15, 45), rng)).capitalize() + "." for _ in range(n)]
+
+
+def synthetic_history(turns, rng):
+    history = []
+    for i in range(turns):
+        words = sample_words(rng.randint(5, 20), rng) + rng.sample(sorted(STOP_WORDS), 4)
+        history.append({"role": "Patient" if i % 2 == 0 else "Assistant", "content": " ".join(words)})
+    return history
+
+
+def per_call(fn, calls):
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - t0) / calls
+
+
+def compare(label, chunks, query, history_for, rng):
+    t0 = time.perf_counter()
+    index = InvertedIndex(chunks)
+    build = time.perf_counter() - t0
+    for turns in (0, 6, 20):
+        history = history_for(turns, rng)
+        # Session keeps keywords for its last six messages, the query included
+        terms = [t for m in ([{"content": query}] + history)[-6:] for t in tokenize(m["content"])]
+        calls = max(3, 2000 // len(chunks))
+        ref = per_call(lambda: reference_context(chunks, query, history), calls)
+        new = per_call(lambda: indexed_context(chunks, index, query, history), calls * 10)
+        cached = per_call(lambda: terms_context(chunks, index, terms), calls * 10)
+        print(f"{label:>7} {turns:>6} {build * 1000:>9.1f} {ref * 1e6:>13.0f} {new * 1e6:>9.0f} {ref / new:>7.1f}x "
+              f"{cached * 1e6:>9.0f} {ref / cached:>7.1f}x")
+
+
+def shipped_history(turns, rng):
+    sentences = [s for chunk in RAG_CHUNKS for s in chunk.split(". ")]
+    return [{"role": "Patient" if i % 2 == 0 else "Assistant", "content": rng.choice(sentences)} for i in range(turns)]
+
+
+def main():
+    rng = random.Random(3)
+    query = "How much does a crown cost with Delta Dental?"
+    print(f"{'chunks':>7} {'turns':>6} {'build ms':>9} {'reference us':>13} {'index us':>9} {'speedup':>8} "
+          f"{'terms us':>9} {'speedup':>8}")
+    for n_chunks in (45, 500, 2000, 5000):
+        compare(n_chunks, synthetic_chunks(n_chunks, rng), query, synthetic_history, rng)
+    compare("shipped", RAG_CHUNKS, query, shipped_history, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Compare per-calendar event listing with one batched freebusy query.
+
+Builds a practice with several provider calendars per location on a fake
+endpoint with simulated request latency. Each turn computes joint
+availability ("any provider at either location") both ways: one paginated
+events().list per calendar, and FreeBusyCache's single freebusy.query. The
+two must agree with a brute-force interval check. The per-office listing
+for the prompt must keep each office to its own hours.
+
+Usage: python benchmarks/bench_scheduler.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from availability import BusyTimeline, parse_busy_periods, render_availability
+from fakes import FakeFreeBusyService
+from scheduler import LOCATIONS, FreeBusyCache, Scheduler
+
+est = pytz.timezone('US/Eastern')
+DAYS_AHEAD = 21
+LATENCY = 0.02
+
+
+def listed_timelines(service, calendar_ids, now):
+    # The single-calendar approach repeated per calendar: N sequential listings
+    timelines = {}
+    for calendar_id in calendar_ids:
+        events = []
+        page_token = None
+        while True:
+            result = service.events().list(
+                calendarId=calendar_id, timeMin=now.isoformat(),
+                timeMax=(now + timedelta(days=DAYS_AHEAD)).isoformat(),
+                singleEvents=True, orderBy='startTime', pageToken=page_token).execute()
+            events += result.get('items', [])
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+        timelines[calendar_id] = BusyTimeline(parse_busy_periods(events, est))
+    return timelines
+
+
+def brute_force(service, location_calendars, duration, now):
+    openings = set()
+    for location, calendar_ids in location_calendars.items():
+        hours = LOCATIONS[location]
+        for day_offset in range(DAYS_AHEAD):
+            day = now.date() + timedelta(days=day_offset)
+            if day.weekday() not in hours['days']:
+                continue
+            slot = est.localize(datetime.combine(day, datetime.min.time().replace(
+                hour=hours['open'][0], minute=hours['open'][1])))
+            close = est.localize(datetime.combine(day, datetime.min.time().replace(
+                hour=hours['close'][0], minute=hours['close'][1])))
+            while slot + timedelta(minutes=duration) <= close:
+                end = slot + timedelta(minutes=duration)
+                for calendar_id in calendar_ids:
+                    calendar = service.calendars[calendar_id]
+                    if slot > now and all(not (slot < e and end > s)
+                                          for s, e in (calendar.bounds[ev['id']] for ev in calendar.live_events())):
+                        openings.add(slot)
+                        break
+                slot += timedelta(minutes=15)
+    return sorted(openings)
+
+
+def populate(service, now, events_per_calendar, rng):
+    for calendar in service.calendars.values():
+        for _ in range(events_per_calendar):
+            day = now.date() + timedelta(days=rng.randrange(DAYS_AHEAD))
+            start = est.localize(datetime.combine(day, datetime.min.time().replace(hour=7))) + timedelta(
+                minutes=15 * rng.randrange(48))
+            calendar.add_event(start, start + timedelta(minutes=rng.choice([30, 45, 60, 90])))
+
+
+def main(turns=5):
+    rng = random.Random(3)
+    now = datetime.now(est)
+    print(f"{'providers':>9} {'calendars':>9} {'list reqs/turn':>14} {'list ms':>8} "
+          f"{'freebusy reqs/turn':>18} {'freebusy ms':>11} {'openings':>8}")
+    for providers in (1, 3, 8, 30):
+        location_calendars = {location: [f"{location.lower()}-{p}" for p in range(providers)]
+                              for location in LOCATIONS}
+        calendar_ids = [c for ids in location_calendars.values() for c in ids]
+        service = FakeFreeBusyService(calendar_ids, page_size=100, latency=LATENCY)
+        populate(service, now, 80, rng)
+        cache = FreeBusyCache(service, calendar_ids, est)
+        scheduler = Scheduler(cache, est, location_calendars=location_calendars)
+
+        list_time = freebusy_time = 0.0
+        for _ in range(turns):
+            duration = rng.choice([30, 45, 90])
+            before = service.requests['events.list']
+            t0 = time.perf_counter()
+            listed = scheduler.free_slots(listed_timelines(service, calendar_ids, now), duration, now=now)
+            list_time += time.perf_counter() - t0
+            list_requests = service.requests['events.list'] - before
+
+            t0 = time.perf_counter()
+            batched = scheduler.free_slots(cache.timelines(max_staleness=0), duration, now=now)
+            freebusy_time += time.perf_counter() - t0
+
+            assert batched == listed == brute_force(service, location_calendars, duration, now), providers
+        # Without a location each office keeps its own openings and hours in the prompt
+        by_location = scheduler.available_by_location(45, days_ahead=DAYS_AHEAD)
+        for location, starts in by_location.items():
+            assert starts == scheduler.available(45, location, DAYS_AHEAD), location
+        assert all((8, 0) <= (s.hour, s.minute) and s + timedelta(minutes=45) <= s.replace(hour=17, minute=0)
+                   for s in by_location["Newport"])
+        listing = render_availability(by_location).splitlines()
+        assert listing.index("Christiana:") < listing.index("Newport:")
+        print(f"{providers:>9} {len(calendar_ids):>9} {list_requests:>14} {list_time / turns * 1000:>8.1f} "
+              f"{service.requests['freebusy.query'] / turns:>18.0f} {freebusy_time / turns * 1000:>11.1f} "
+              f"{len(batched):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Load test for the headless conversation server with fake backends.
+
+Starts server.ConversationServer in-process on a free port, with the agent
+configured against FakeCalendarService and StubLLM. Many simulated texting
+threads then send their messages in quick bursts, the way SMS arrives.
+Reports throughput, latency percentiles and 503s (clients retry after
+Retry-After). It also checks that no conversation ever has two agent()
+calls running at once, that every history alternates patient/assistant, and
+that each conversation's messages were answered in the order the server
+admitted them (concurrent connections and retries mean that need not be
+the order they were sent).
+
+Usage: python benchmarks/bench_server.py --conversations 300 --workers 32 --max-pending 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+import assistant
+from bench_agent import percentile, seed_calendar, synthetic_conversations
+from calendar_cache import EventCache
+from fakes import FakeCalendarService, StubLLM
+from server import Busy, ConversationServer
+
+overlaps = 0
+running = set()
+running_lock = threading.Lock()
+
+
+def exclusive(agent):
+    # Counts agent() calls that start while the same conversation is running
+    def checked(user_message, session, **kwargs):
+        global overlaps
+        key = id(session)
+        with running_lock:
+            if key in running:
+                overlaps += 1
+            running.add(key)
+        try:
+            return agent(user_message, session, **kwargs)
+        finally:
+            with running_lock:
+                running.discard(key)
+    return checked
+
+
+async def post(port, conversation_id, text):
+    body = json.dumps({"conversation_id": conversation_id, "text": text}).encode()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST /message HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b" ", 2)[1])
+    return status, json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def send(port, conversation_id, text, stats):
+    t0 = time.perf_counter()
+    while True:
+        status, payload = await post(port, conversation_id, text)
+        if status != 503:
+            break
+        stats["rejected"] += 1
+        await asyncio.sleep(random.uniform(0.5, 1.5))
+    stats["latencies"].append(time.perf_counter() - t0)
+    assert status == 200, payload
+
+
+async def conversation(port, conversation_id, messages, stats):
+    # A burst: each message goes out shortly after the previous one, without
+    # waiting for its reply
+    tasks = []
+    for message in messages:
+        tasks.append(asyncio.create_task(send(port, conversation_id, message["content"], stats)))
+        await asyncio.sleep(0.005)
+    await asyncio.gather(*tasks)
+
+
+async def main_async(args):
+    server = ConversationServer(args.workers, args.max_pending)
+    admitted = defaultdict(list)
+    handle_message = server.handle_message
+
+    async def recording(conversation_id, text):
+        # Admission happens synchronously when handle_message is called
+        entry = [text]
+        admitted[conversation_id].append(entry)
+        try:
+            return await handle_message(conversation_id, text)
+        except Busy:
+            # By identity: the same text may have been admitted earlier
+            admitted[conversation_id] = [e for e in admitted[conversation_id] if e is not entry]
+            raise
+    server.handle_message = recording
+    listener = await server.serve("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+
+    conversations = synthetic_conversations(args.conversations, random.Random(2))
+    stats = {"latencies": [], "rejected": 0}
+    t0 = time.perf_counter()
+    await asyncio.gather(*(conversation(port, f"+1302555{i:04d}", c["messages"], stats)
+                           for i, c in enumerate(conversations)))
+    elapsed = time.perf_counter() - t0
+    listener.close()
+
+    out_of_order = 0
+    for i, c in enumerate(conversations):
+        conversation_id = f"+1302555{i:04d}"
+        history = list(server.sessions.get(conversation_id).messages)
+        assert [role for role, _ in history] == ["Patient", "Assistant"] * (len(history) // 2)
+        out_of_order += [content for _, content in history[::2]] != [e[0] for e in admitted[conversation_id]]
+    latencies = stats["latencies"]
+    print(f"{args.conversations} conversations, {len(latencies)} messages, {args.workers} workers, "
+          f"max pending {args.max_pending}, stub LLM {args.llm_latency * 1000:.0f} ms")
+    print(f"throughput: {len(latencies) / elapsed:.1f} messages/s over {elapsed:.2f} s")
+    print("latency ms: " + ", ".join(f"p{q} {percentile(latencies, q) * 1000:.0f}" for q in (50, 95, 99)))
+    print(f"503 responses: {stats['rejected']}, overlapping turns: {overlaps}, "
+          f"conversations out of order: {out_of_order}")
+    assert overlaps == 0 and out_of_order == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    calendar = FakeCalendarService()
+    seed_calendar(calendar, 20, random.Random(1))
+    assistant.configure(EventCache(calendar, "bench", assistant.est), StubLLM(latency=args.llm_latency))
+    assistant.agent = exclusive(assistant.agent)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
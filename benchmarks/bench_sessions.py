@@ -0,0 +1,168 @@
+"""Per-turn conversation bookkeeping: full-history rescans vs the session store.
+
+For conversations of growing length, times what a turn spends deriving
+service, location, scheduling intent and the requested day, and building
+the prompt's conversation section, the old way (rescanning and pasting the
+whole history) against Session.add plus the token-budgeted window. Checks
+that both derive the same facts on the synthetic conversations, reports
+prompt size and memory per conversation, and checks SessionStore's cap and
+idle eviction.
+
+Usage: python benchmarks/bench_sessions.py
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+import assistant
+from bench_agent import synthetic_conversations
+from entities import EntityExtractor, resolve_dates
+from sessions import SessionStore
+
+FILLER = [
+    "Do you take Delta Dental insurance for that?",
+    "Sure, could you tell me a bit more about what you need?",
+    "How long does the visit usually take?",
+    "Most cleanings take about 45 minutes.",
+]
+
+
+def long_conversation(turns, rng):
+    # A synthetic booking conversation padded with FAQ back-and-forth
+    base = synthetic_conversations(1, rng)[0]["messages"]
+    messages = []
+    while len(messages) < turns:
+        for m in base:
+            role = "Patient" if m["role"] == "patient" else "Assistant"
+            messages.append((role, m["content"]))
+            messages.append(("Assistant" if role == "Patient" else "Patient", rng.choice(FILLER)))
+    return messages[:turns]
+
+
+# The old helpers saw dates, times and scheduling words only, not the practice's tables
+basic_extractor = EntityExtractor()
+
+
+def is_scheduling_conversation(messages):
+    # answer_cache's check before sessions: once any message is about booking, every later turn needs the calendar
+    return any(basic_extractor.extract(text).scheduling for text in messages)
+
+
+def requested_window(messages, now, days_ahead=21):
+    # availability's before sessions: newest patient message mentioning a date (or part of day) wins
+    dates = hours = None
+    for text in reversed(messages):
+        found = basic_extractor.extract(text)
+        if dates is None:
+            dates = resolve_dates(found.dates, now.date(), days_ahead) or None
+        if hours is None:
+            hours = found.hours
+        if dates is not None and hours is not None:
+            break
+    return dates, hours
+
+
+def old_turn(history, user_message, now):
+    # What agent() derived from conversation_history on every turn
+    full_convo = " ".join([m["content"] for m in history]) + " " + user_message
+    service = next((s for s in assistant.SERVICE_DURATIONS if s in full_convo.lower()), "cleaning")
+    location = None
+    if "christiana" in full_convo.lower():
+        location = "Christiana"
+    elif "newport" in full_convo.lower():
+        location = "Newport"
+    scheduling = is_scheduling_conversation([m["content"] for m in history] + [user_message])
+    patient_messages = [m["content"] for m in history if m["role"] == "Patient"] + [user_message]
+    window = requested_window(patient_messages, now)
+    prompt = "".join(f"{m['role']}: {m['content']}\n" for m in history)
+    return (service, location, scheduling, window), prompt
+
+
+def new_turn(session, role, content, now):
+    session.add(role, content)
+    lines, omitted = session.window(assistant.PROMPT_HISTORY_TOKENS * 4)
+    facts = (session.service or "cleaning", session.location, session.scheduling, session.requested_window(now))
+    return facts, "".join(lines)
+
+
+def replay(messages, now):
+    # Per-turn seconds and prompt chars for both paths; facts must agree
+    history = []
+    session = assistant.new_session()
+    old_seconds = new_seconds = 0.0
+    old_chars = new_chars = 0
+    for role, content in messages:
+        if role == "Patient":
+            t0 = time.perf_counter()
+            old_facts, old_prompt = old_turn(history, content, now)
+            old_seconds += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            new_facts, new_prompt = new_turn(session, role, content, now)
+            new_seconds += time.perf_counter() - t0
+            assert old_facts == new_facts, (old_facts, new_facts)
+            old_chars, new_chars = len(old_prompt), len(new_prompt)
+        else:
+            session.add(role, content)
+        history.append({"role": role, "content": content})
+    patient_turns = sum(1 for role, _ in messages if role == "Patient")
+    return old_seconds / patient_turns, new_seconds / patient_turns, old_chars, new_chars
+
+
+def memory_per_conversation(messages, build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build(messages) for _ in range(50)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del kept
+    return sum(s.size_diff for s in after.compare_to(before, "filename")) / 50
+
+
+def as_history(messages):
+    return [{"role": role, "content": content} for role, content in messages]
+
+
+def as_session(messages):
+    session = assistant.new_session()
+    for role, content in messages:
+        session.add(role, content)
+    return session
+
+
+def main():
+    rng = random.Random(4)
+    now = datetime.now(assistant.est)
+    for conversation in synthetic_conversations(200, rng):
+        replay([("Patient" if m["role"] == "patient" else "Assistant", m["content"])
+                for m in conversation["messages"]], now)
+    print("facts match on 200 synthetic conversations")
+
+    print(f"\n{'messages':>8} {'old us/turn':>12} {'new us/turn':>12} {'old prompt':>11} {'new prompt':>11} "
+          f"{'old KB':>8} {'new KB':>8}")
+    for turns in (10, 50, 200, 1000):
+        messages = long_conversation(turns, rng)
+        old, new, old_chars, new_chars = replay(messages, now)
+        old_kb = memory_per_conversation(messages, as_history) / 1024
+        new_kb = memory_per_conversation(messages, as_session) / 1024
+        print(f"{turns:>8} {old * 1e6:>12.0f} {new * 1e6:>12.0f} {old_chars:>11} {new_chars:>11} "
+              f"{old_kb:>8.1f} {new_kb:>8.1f}")
+        assert new_chars <= assistant.PROMPT_HISTORY_TOKENS * 4
+
+    store = SessionStore(assistant.new_session, max_sessions=1000, idle_seconds=60)
+    for i in range(5000):
+        store.get(f"+1302555{i:04d}").add("Patient", "Do you take Delta Dental?")
+    assert len(store) == 1000 and store.evicted == 4000
+    for session in list(store._sessions.values())[:400]:
+        session.last_active -= 120
+    store.get("+13025559999")
+    assert len(store) == 601
+    print(f"\nstore: capped at {store.max_sessions}, {store.evicted} evicted, {len(store)} after idle eviction")
+
+
+if __name__ == "__main__":
+    main()
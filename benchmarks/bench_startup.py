@@ -0,0 +1,83 @@
+"""Cold-start cost of the Streamlit entry point, before and after lazy clients.
+
+Each scenario runs in a fresh interpreter (median of REPEAT runs):
+
+- page render imports: what app.py imported at the top of every run before
+  (Vertex AI and Google API client SDKs) versus now (only the agent core).
+- calendar client: build('calendar', 'v3') from the bundled discovery
+  document, which app.py used to repeat on every rerun.
+- first message: configure the agent with fakes and answer one scheduling
+  turn, measured from interpreter start.
+
+Scenarios whose packages are not installed are reported as such.
+
+Usage: python benchmarks/bench_startup.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+REPEAT = 5
+
+TIMER = "import time; t0 = time.perf_counter()\n"
+REPORT = "\nprint(time.perf_counter() - t0)"
+
+SCENARIOS = [
+    ("page render imports (before)", """
+import vertexai
+from vertexai.generative_models import GenerativeModel
+from googleapiclient.discovery import build
+from google.oauth2 import service_account
+import assistant, calendar_cache, scheduler, tracing
+"""),
+    ("page render imports (after)", """
+import assistant, calendar_cache, scheduler, tracing
+"""),
+    ("calendar client build, per rerun (before)", """
+from googleapiclient.discovery import build
+t0 = time.perf_counter()
+build('calendar', 'v3', developerKey='bench', static_discovery=True, cache_discovery=False)
+"""),
+    ("first message with fakes (after)", """
+import assistant
+from calendar_cache import EventCache
+from fakes import FakeCalendarService, StubLLM
+assistant.configure(EventCache(FakeCalendarService(), 'bench', assistant.est), StubLLM(latency=0))
+session = assistant.new_session()
+session.add("Patient", "Can I book a cleaning at Newport on Tuesday morning?")
+assistant.agent("Can I book a cleaning at Newport on Tuesday morning?", session)
+"""),
+]
+
+
+def run(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.join(ROOT, "streamlit"), os.path.join(ROOT, "benchmarks")]))
+    result = subprocess.run([sys.executable, "-c", TIMER + code + REPORT],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        if "ModuleNotFoundError" in result.stderr:
+            return None
+        raise RuntimeError(result.stderr)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    print(f"{'scenario':<44} {'median ms':>10}")
+    for name, code in SCENARIOS:
+        timings = []
+        for _ in range(REPEAT):
+            elapsed = run(code)
+            if elapsed is None:
+                break
+            timings.append(elapsed)
+        if timings:
+            print(f"{name:<44} {statistics.median(timings) * 1000:>10.1f}")
+        else:
+            print(f"{name:<44} {'not installed':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark the memory-mapped embedding index with the hashing encoder.
+
+Reports build time, open time (mmap, so independent of matrix size) and
+per-query latency for single and batched queries, and checks that every
+chunk retrieves itself as the top hit.
+
+Usage: python benchmarks/bench_vector_index.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+from bench_retrieval import synthetic_chunks
+from vector_index import HashingEncoder, VectorIndex, build_index
+
+
+def main():
+    rng = random.Random(5)
+    print(f"{'chunks':>7} {'dtype':>8} {'build ms':>9} {'open ms':>8} {'1 query us':>11} {'64 batch us/q':>14}")
+    for n_chunks in (45, 2000, 20000):
+        chunks = synthetic_chunks(n_chunks, rng)
+        for dtype in ("float16", "float32"):
+            with tempfile.TemporaryDirectory() as path:
+                t0 = time.perf_counter()
+                build_index(chunks, HashingEncoder(), path, dtype=dtype)
+                build = time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                index = VectorIndex(path)
+                opened = time.perf_counter() - t0
+
+                probes = rng.sample(range(n_chunks), min(64, n_chunks))
+                queries = [chunks[i] for i in probes]
+                t0 = time.perf_counter()
+                for q in queries:
+                    index.search([q], k=10)
+                single = (time.perf_counter() - t0) / len(queries)
+
+                t0 = time.perf_counter()
+                results = index.search(queries, k=10)
+                batched = (time.perf_counter() - t0) / len(queries)
+
+                for i, hits in zip(probes, results):
+                    assert chunks[hits[0][0]] == chunks[i], "chunk did not retrieve itself"
+                print(f"{n_chunks:>7} {dtype:>8} {build * 1000:>9.0f} {opened * 1000:>8.2f} "
+                      f"{single * 1e6:>11.0f} {batched * 1e6:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
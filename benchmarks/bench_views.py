@@ -0,0 +1,124 @@
+"""Materialized availability views: correctness under changes, and lookup cost.
+
+Runs against both busy-time sources, EventCache (one demo calendar serving
+both offices) and FreeBusyCache (a calendar per provider). Each step makes
+a change: an external event, a cancellation, a booking, or an expired sync
+token. Then every (location, duration) view is compared with a from-scratch
+Scheduler.openings over the same timelines, including a day after the date
+rolls over. It reports how many calendar-days each change rebuilt, and
+lookup time against recomputing.
+
+Usage: python benchmarks/bench_views.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "streamlit"))
+
+import assistant
+from calendar_cache import EventCache
+from fakes import FakeCalendarService, FakeFreeBusyService
+from scheduler import LOCATIONS, FreeBusyCache, Scheduler
+
+DURATIONS = sorted(set(assistant.SERVICE_DURATIONS.values()))
+LOCATION_CALENDARS = {"Christiana": ["christiana-1", "christiana-2", "christiana-3"],
+                      "Newport": ["newport-1", "newport-2"]}
+STEPS = 150
+
+
+def random_event(calendar, now, rng):
+    day = now.date() + timedelta(days=rng.randrange(21))
+    start = assistant.est.localize(datetime.combine(day, datetime.min.time().replace(hour=7, minute=30)))
+    start += timedelta(minutes=15 * rng.randrange(44))
+    return calendar.add_event(start, start + timedelta(minutes=rng.choice([15, 30, 45, 60, 90])))
+
+
+def check(scheduler, now):
+    timelines = scheduler.source.timelines()
+    for location in [None] + list(LOCATIONS):
+        for duration in DURATIONS:
+            expected = scheduler.openings(timelines, duration, location, now=now)
+            assert scheduler.views.openings(duration, location, now=now) == expected, (location, duration)
+
+
+def exercise(name, scheduler, calendars, rng):
+    now = datetime.now(assistant.est)
+    for calendar in calendars.values():
+        for _ in range(150):
+            random_event(calendar, now, rng)
+    check(scheduler, now)
+    rebuilt = []
+    for step in range(STEPS):
+        calendar_id = rng.choice(list(calendars))
+        calendar = calendars[calendar_id]
+        action = rng.random()
+        if action < 0.4:
+            random_event(calendar, now, rng)
+        elif action < 0.7:
+            live = calendar.live_events()
+            if live:
+                calendar.cancel_event(rng.choice(live)["id"])
+        elif action < 0.95:
+            location = rng.choice(list(LOCATIONS))
+            duration = rng.choice(DURATIONS)
+            slots = scheduler.available(duration, location)
+            if slots:
+                slot = rng.choice(slots)
+                scheduler.book(slot, location, duration, {
+                    'summary': 'Cleaning - Bench Patient',
+                    'start': {'dateTime': slot.isoformat()},
+                    'end': {'dateTime': (slot + timedelta(minutes=duration)).isoformat()}})
+        elif hasattr(calendar, "expire_sync_tokens"):
+            calendar.expire_sync_tokens()
+        before = scheduler.views.rebuilt_days
+        scheduler.source.refresh(max_staleness=0)
+        check(scheduler, now)
+        rebuilt.append(scheduler.views.rebuilt_days - before)
+
+    tomorrow = now + timedelta(days=1)
+    before = scheduler.views.rebuilt_days
+    check(scheduler, tomorrow)
+    rolled = scheduler.views.rebuilt_days - before
+
+    timelines = scheduler.source.timelines()
+    day = next(d for d in (now.date() + timedelta(days=i) for i in range(1, 8)) if d.weekday() in LOCATIONS["Newport"]["days"])
+    calls = 200
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        scheduler.openings(timelines, 45, "Newport")
+    scratch = (time.perf_counter() - t0) / calls
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        scheduler.available(45, "Newport")
+    view = (time.perf_counter() - t0) / calls
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        scheduler.day_openings(day, 45, "Newport")
+    day_view = (time.perf_counter() - t0) / calls
+    calendar_days = len(scheduler.source.calendar_ids) * 22
+    print(f"{name:<14} {sorted(rebuilt)[len(rebuilt) // 2]:>6} {max(rebuilt):>5} {rolled:>7} {calendar_days:>6} "
+          f"{scratch * 1e6:>11.0f} {view * 1e6:>9.0f} {day_view * 1e6:>9.0f}")
+
+
+def main():
+    rng = random.Random(6)
+    print(f"{len(DURATIONS)} durations x {len(LOCATIONS)} locations, {STEPS} changes each, views match from-scratch openings")
+    print(f"{'source':<14} {'rebuilt p50':>6} {'max':>5} {'rollover':>7} {'of':>6} "
+          f"{'scratch us':>11} {'view us':>9} {'day us':>9}")
+
+    calendar = FakeCalendarService()
+    source = EventCache(calendar, "demo", assistant.est, max_staleness=3600)
+    exercise("EventCache", Scheduler(source, assistant.est, durations=DURATIONS), {"demo": calendar}, rng)
+
+    calendar_ids = [c for ids in LOCATION_CALENDARS.values() for c in ids]
+    service = FakeFreeBusyService(calendar_ids)
+    source = FreeBusyCache(service, calendar_ids, assistant.est, max_staleness=3600)
+    scheduler = Scheduler(source, assistant.est, location_calendars=LOCATION_CALENDARS, durations=DURATIONS)
+    exercise("FreeBusyCache", scheduler, service.calendars, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""In-memory stand-ins for the Google APIs the agent talks to."""
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from dateutil import parser as date_parser
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Resp", (), {"status": status})()
+
+
+class FakeCalendarService:
+    """Mimics calendar.events() list/insert, including sync tokens and paging.
+
+    Every change is stamped with a sequence number; a sync token is simply the
+    sequence number at the time it was issued. `requests` counts calls by
+    method so callers can assert how much traffic a code path generates.
+    """
+
+    def __init__(self, page_size=250):
+        self.page_size = page_size
+        self.events_by_id = {}
+        self.changed_at = {}
+        self.bounds = {}
+        self.seq = 0
+        self.min_valid_token = 0
+        self.requests = Counter()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _stamp(self, event):
+        self.seq += 1
+        self.changed_at[event['id']] = self.seq
+        self.bounds[event['id']] = tuple(
+            date_parser.parse(event[key].get('dateTime', event[key].get('date'))) for key in ('start', 'end'))
+
+    def add_event(self, start, end, summary="Busy"):
+        with self._lock:
+            self._next_id += 1
+            event = {
+                'id': f"evt{self._next_id}",
+                'status': 'confirmed',
+                'summary': summary,
+                'start': {'dateTime': start.isoformat()},
+                'end': {'dateTime': end.isoformat()},
+            }
+            self.events_by_id[event['id']] = event
+            self._stamp(event)
+            return event
+
+    def add_all_day_event(self, day, summary="Closed"):
+        with self._lock:
+            self._next_id += 1
+            event = {
+                'id': f"evt{self._next_id}",
+                'status': 'confirmed',
+                'summary': summary,
+                'start': {'date': day.isoformat()},
+                'end': {'date': (day + timedelta(days=1)).isoformat()},
+            }
+            self.events_by_id[event['id']] = event
+            self._stamp(event)
+            return event
+
+    def cancel_event(self, event_id):
+        with self._lock:
+            self.events_by_id[event_id] = dict(self.events_by_id[event_id], status='cancelled')
+            self._stamp(self.events_by_id[event_id])
+
+    def expire_sync_tokens(self):
+        self.min_valid_token = self.seq + 1
+
+    def live_events(self):
+        return [e for e in self.events_by_id.values() if e['status'] != 'cancelled']
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, singleEvents=True, timeMin=None, timeMax=None, orderBy=None,
+             syncToken=None, pageToken=None, **kwargs):
+        def run():
+            with self._lock:
+                self.requests['events.list'] += 1
+                if syncToken is not None:
+                    since = int(syncToken)
+                    if since < self.min_valid_token:
+                        raise FakeHttpError(410)
+                    items = [self.events_by_id[i] for i, seq in self.changed_at.items() if seq > since]
+                else:
+                    items = self.live_events()
+                    if timeMin:
+                        lo = date_parser.parse(timeMin)
+                        items = [e for e in items if _aware(self.bounds[e['id']][1], lo) > lo]
+                    if timeMax:
+                        hi = date_parser.parse(timeMax)
+                        items = [e for e in items if _aware(self.bounds[e['id']][0], hi) < hi]
+                if orderBy == 'startTime':
+                    items.sort(key=lambda e: e['start'].get('dateTime', e['start'].get('date')))
+                offset = int(pageToken or 0)
+                page = items[offset:offset + self.page_size]
+                result = {'items': [dict(e) for e in page]}
+                if offset + self.page_size < len(items):
+                    result['nextPageToken'] = str(offset + self.page_size)
+                elif orderBy is None:
+                    result['nextSyncToken'] = str(self.seq)
+                return result
+        return _Request(run)
+
+    def insert(self, calendarId, body):
+        def run():
+            with self._lock:
+                self.requests['events.insert'] += 1
+                self._next_id += 1
+                event = dict(body, id=f"evt{self._next_id}", status='confirmed')
+                self.events_by_id[event['id']] = event
+                self._stamp(event)
+                return dict(event)
+        return _Request(run)
+
+
+class FakeFreeBusyService:
+    """Several FakeCalendarService calendars behind one client.
+
+    events() list/insert are routed by calendarId and freebusy().query
+    answers for many calendars at once with merged busy blocks, like the
+    real endpoint. Unknown calendar ids come back with a notFound error.
+    Each request sleeps `latency` seconds to stand in for the network.
+    """
+
+    def __init__(self, calendar_ids, page_size=250, latency=0.0):
+        self.calendars = {calendar_id: FakeCalendarService(page_size) for calendar_id in calendar_ids}
+        self.latency = latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+    def _counted(self, method, fn):
+        def run():
+            with self._lock:
+                self.requests[method] += 1
+            time.sleep(self.latency)
+            return fn()
+        return _Request(run)
+
+    def events(self):
+        return self
+
+    def freebusy(self):
+        return self
+
+    def list(self, calendarId, **kwargs):
+        return self._counted('events.list', self.calendars[calendarId].list(calendarId, **kwargs).execute)
+
+    def insert(self, calendarId, body):
+        return self._counted('events.insert', self.calendars[calendarId].insert(calendarId, body).execute)
+
+    def _busy(self, calendar, lo, hi):
+        with calendar._lock:
+            bounds = [calendar.bounds[e['id']] for e in calendar.live_events()]
+        merged = []
+        for start, end in sorted((_aware(start, lo), _aware(end, lo)) for start, end in bounds):
+            if end <= lo or start >= hi:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in merged]
+
+    def query(self, body):
+        def run():
+            lo = date_parser.parse(body['timeMin'])
+            hi = date_parser.parse(body['timeMax'])
+            result = {'timeMin': body['timeMin'], 'timeMax': body['timeMax'], 'calendars': {}}
+            for item in body['items']:
+                calendar = self.calendars.get(item['id'])
+                if calendar is None:
+                    result['calendars'][item['id']] = {'errors': [{'domain': 'global', 'reason': 'notFound'}], 'busy': []}
+                else:
+                    result['calendars'][item['id']] = {'busy': self._busy(calendar, lo, hi)}
+            return result
+        return self._counted('freebusy.query', run)
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeQuotaError(Exception):
+    # Shaped like google.api_core's ResourceExhausted
+    code = 429
+
+
+class StubLLM:
+    """generate_content stand-in with a fixed latency and a scripted reply.
+
+    Once the latest patient message confirms, the reply carries a BOOKED:
+    line for the first opening listed in the prompt, using the name the
+    patient gave ("my name is ..."). Otherwise it returns a short canned
+    answer. Streaming splits the latency evenly across `chunks` pieces.
+
+    Faults can be injected. A `failure_rate` share of requests raise
+    FakeQuotaError before the first chunk. A `slow_rate` share wait an extra
+    `slow_latency` seconds for it. `active` and `peak` count concurrent
+    requests.
+    """
+
+    CONFIRM_RE = re.compile(r"\b(yes|confirm|book it|that works|sounds good)\b", re.I)
+    NAME_RE = re.compile(r"my name is ([A-Z][a-z]+ [A-Z][a-z]+)")
+    SERVICE_RE = re.compile(r"SERVICE BEING SCHEDULED: (.+?) \(")
+    OPENING_RE = re.compile(r"^(\w+day, \w{3} \d{2}, \d{4}): (\d{1,2}:\d{2} [AP]M)", re.M)
+
+    def __init__(self, latency=0.3, chunks=5, failure_rate=0.0, slow_rate=0.0, slow_latency=0.0, seed=None):
+        self.latency = latency
+        self.chunks = chunks
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = 0
+        self.failures = 0
+        self.active = 0
+        self.peak = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reply(self, prompt):
+        conversation = prompt.rsplit("Conversation:\n", 1)[-1]
+        patient_lines = [l[len("Patient: "):] for l in conversation.split("\n") if l.startswith("Patient: ")]
+        last = patient_lines[-1] if patient_lines else ""
+        if self.CONFIRM_RE.search(last):
+            name = self.NAME_RE.search(conversation)
+            service = self.SERVICE_RE.search(prompt)
+            opening = self.OPENING_RE.search(prompt)
+            location = "Christiana" if "christiana" in conversation.lower() else "Newport"
+            if name and service and opening:
+                return (f"You're all set!\nBOOKED: {name.group(1)}, {service.group(1).title()}, "
+                        f"{location}, {opening.group(1)} at {opening.group(2)}")
+        return "Thanks for reaching out to Avalon Dental! Happy to help with that. Is there anything else you need?"
+
+    def generate_content(self, prompt, stream=False):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            delay = self.slow_latency if self._rng.random() < self.slow_rate else 0.0
+        text = self.reply(prompt)
+        if not stream:
+            return _Chunk("".join(chunk.text for chunk in self._stream(text, fail, delay)))
+        return self._stream(text, fail, delay)
+
+    def _stream(self, text, fail=False, delay=0.0):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(delay)
+            if fail:
+                with self._lock:
+                    self.failures += 1
+                raise FakeQuotaError("429 Resource exhausted")
+            size = max(1, -(-len(text) // self.chunks))
+            for start in range(0, len(text), size):
+                time.sleep(self.latency / self.chunks)
+                yield _Chunk(text[start:start + size])
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _aware(value, reference):
+    return value if value.tzinfo else value.replace(tzinfo=reference.tzinfo)
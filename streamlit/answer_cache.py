@@ -0,0 +1,76 @@
+import string
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+def normalize_query(text):
+    return " ".join(text.lower().translate(_PUNCTUATION).split())
+
+
+class AnswerCache:
+    """LRU + TTL cache of assistant replies to FAQ turns.
+
+    Keys are the normalized patient message plus the ids of the chunks that
+    were retrieved for it, so a knowledge-base change naturally misses.
+    Entries are shared between patients, so the agent only caches the first
+    message of a conversation, whose reply depends on nothing but the key.
+    Each entry remembers how long the original answer took, which is what a
+    hit saves.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.calendar_fetches_skipped = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, query, chunk_ids):
+        return normalize_query(query), tuple(chunk_ids)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+    def put(self, key, answer, cost_seconds):
+        with self._lock:
+            self._entries[key] = (answer, cost_seconds, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        # The knowledge base changed under the cached answers
+        with self._lock:
+            self._entries.clear()
+
+    def skipped_calendar_fetch(self):
+        with self._lock:
+            self.calendar_fetches_skipped += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "calendar_fetches_skipped": self.calendar_fetches_skipped,
+            }
@@ -0,0 +1,357 @@
+"""Scheduling assistant core: retrieval, availability, booking and the agent turn.
+
+Nothing here talks to Streamlit or builds Google clients. The entry point
+(app.py, or a benchmark with fakes) calls configure() once per process with
+a busy-time source (EventCache for one calendar, FreeBusyCache for one per
+provider) and an LLM exposing generate_content(prompt, stream=True), which
+is wrapped in an LLMClient unless it already is one.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytz
+
+import tracing
+from answer_cache import AnswerCache
+from availability import render_availability
+from knowledge_base import KnowledgeBase, Snapshot, describe_hours
+from llm_client import LLMClient
+from retrieval import reciprocal_rank_fusion
+from reservations import SlotTaken
+from scheduler import LOCATIONS, Scheduler
+from sessions import Session
+
+est = pytz.timezone('US/Eastern')
+
+event_cache = None
+scheduler = None
+gemini = None
+vector_index = None
+executor = ThreadPoolExecutor(max_workers=8)
+answer_cache = AnswerCache(max_entries=256, ttl=3600)
+# Conversation history in the prompt; older turns are summarized as facts
+PROMPT_HISTORY_TOKENS = 1500
+
+def configure(calendar, llm, vector_index_dir=None, location_calendars=None, knowledge_dir=None,
+              knowledge_snapshot=None):
+    global event_cache, scheduler, gemini, vector_index, knowledge
+    # Optional: the JSON knowledge base, reloaded when its files change
+    if knowledge_dir and os.path.isdir(knowledge_dir):
+        knowledge = KnowledgeBase(knowledge_dir, knowledge_snapshot)
+        knowledge.listeners.append(knowledge_changed)
+    kb = knowledge.current()
+    event_cache = calendar
+    scheduler = Scheduler(calendar, est, locations=kb.locations, location_calendars=location_calendars,
+                          durations=kb.service_durations.values())
+    # Every model call goes through the client: concurrency cap, retries, coalescing
+    gemini = llm if isinstance(llm, LLMClient) else LLMClient(llm)
+    # Optional: only present when built offline with vector_index.py
+    if vector_index_dir and os.path.isdir(vector_index_dir):
+        from vector_index import VectorIndex
+        vector_index = VectorIndex(vector_index_dir)
+
+def knowledge_changed(kb):
+    # New hours and durations for the availability views; cached answers may be stale
+    scheduler.set_locations(kb.locations, kb.service_durations.values())
+    answer_cache.clear()
+
+# The built-in knowledge base, used unless configure() is given a knowledge_dir
+SERVICE_DURATIONS = {
+    "cleaning": 45,
+    "new patient exam": 60,
+    "filling": 45,
+    "crown": 90,
+    "root canal": 90,
+    "extraction": 30,
+    "whitening": 60,
+    "emergency": 30,
+    "consultation": 45,
+    "implant": 90,
+    "braces consultation": 45,
+}
+
+# Names patients use for each provider, for the session's provider fact
+PROVIDERS = {
+    "Dr. Parham Farhi": ["parham", "parham farhi", "dr. farhi"],
+    "Dr. Adeline Farhi": ["adeline", "adeline farhi"],
+    "Dr. James Wilson": ["james wilson", "wilson"],
+    "Lisa Thompson": ["lisa", "lisa thompson"],
+}
+
+def get_duration(service_type, kb=None):
+    kb = kb or knowledge.current()
+    services = kb.extractor.extract(service_type).services
+    return kb.service_durations[services[0]] if services else 60
+
+RAG_CHUNKS = [
+    "Avalon Dental Christiana is located at 430 Christiana Medical Center, Newark, DE 19702. Phone: 302-292-8899. Hours: Monday-Thursday 7:30 AM - 6:30 PM. Closed Friday-Sunday.",
+    "Avalon Dental Newport is located at 406 Larch Circle, Newport, DE 19804. Phone: 302-999-8822. Hours: Monday-Thursday 8:00 AM - 5:00 PM. Closed Friday-Sunday.",
+    "Contact Avalon Dental by phone at 302-292-8899, text at 302-300-4614 (preferred), or email at avalondentalde@gmail.com.",
+    "For dental emergencies, call the office directly. After-hours emergencies should call the main line for the on-call doctor's contact information.",
+    "Avalon Dental requires 2 days (48 hours) notice for cancellations. This helps us offer the time slot to other patients and maintains your eligibility for the Rewards Program.",
+    "Late cancellations or no-shows may result in a $50 fee and could affect rewards program eligibility.",
+    "The Avalon Dental Savings Plan costs $60 to enroll. Benefits include: Exam, Cleaning and X-rays for $175, 15% off all dental services, no waiting periods, no annual maximums, and priority scheduling.",
+    "The savings plan is ideal for patients without dental insurance or those wanting additional coverage beyond their insurance benefits.",
+    "Dr. Parham Farhi (DDS) is the founder of Avalon Dental. He specializes in Cosmetic Dentistry, Root Canals, Implant Placement, and Braces/Orthodontics. He graduated from Baltimore College of Dental Surgery in 2002 and has over 20 years of experience. He is passionate about creating beautiful smiles and making dental visits comfortable.",
+    "Dr. Adeline Farhi (DDS) specializes in General Dentistry, Cosmetic Dentistry, and Children's Dentistry. She graduated from Temple University Dental School in 2015. She is known for her gentle approach and expertise in pediatric care.",
+    "Dr. James Wilson (DMD) specializes in Oral Surgery, Wisdom Teeth Extraction, and Implant Surgery. He graduated from University of Pennsylvania Dental School in 2010 and handles complex surgical cases.",
+    "Lisa Thompson (RDH) is a Dental Hygienist specializing in Cleanings, Periodontal Care, and Patient Education. She has been with Avalon Dental since 2018 and is known for making cleanings comfortable.",
+    "Cleaning: Routine cleaning for patients with healthy gums. Includes plaque removal, polishing, and flossing. Duration: 45 minutes. Cost: $100-$150.",
+    "New Patient Exam: Comprehensive exam including full mouth X-rays, oral cancer screening, and treatment planning. Duration: 60 minutes. Cost: $150-$200. Includes discussion of findings and personalized care plan.",
+    "Deep Cleaning (Scaling and Root Planing): Treatment for gum disease involving cleaning below the gumline. Duration: 90 minutes. Cost: $200-$400 per quadrant. May require multiple visits.",
+    "Filling: Tooth-colored composite filling to repair cavities. Duration: 45 minutes. Cost: $150-$300 per tooth.",
+    "Crown: Full coverage restoration for damaged teeth. Custom-made ceramic or porcelain crown. Duration: 90 minutes (2 visits). Cost: $900-$1400. First visit for prep and impressions, second for placement.",
+    "Root Canal: Treatment to save infected or damaged tooth by removing infected pulp. Duration: 90 minutes. Cost: $700-$1200. Crown recommended after procedure.",
+    "Dental Bridge: Fixed replacement for one or more missing teeth anchored to adjacent teeth. Duration: 90 minutes (2 visits). Cost: $2000-$4000.",
+    "Teeth Whitening: Professional in-office teeth whitening treatment. Duration: 60 minutes. Cost: $300-$500. Results typically 6-8 shades whiter.",
+    "Veneers: Thin porcelain shells bonded to front teeth for cosmetic improvement. Duration: 90 minutes (2 visits). Cost: $800-$1500 per tooth.",
+    "Bonding: Cosmetic repair using tooth-colored resin for chips, gaps, or discoloration. Duration: 45 minutes. Cost: $200-$400 per tooth.",
+    "Extraction: Simple tooth removal for damaged or problematic teeth. Duration: 30 minutes. Cost: $150-$300. Complex extractions may cost more.",
+    "Wisdom Teeth Extraction: Surgical removal of wisdom teeth. Duration: 60-90 minutes. Cost: $300-$600 per tooth. Sedation available.",
+    "Dental Implant Placement: Surgical placement of titanium implant fixture to replace missing tooth. Duration: 90 minutes. Cost: $1500-$2500. Abutment and crown separate.",
+    "Braces Consultation: Evaluation for braces or clear aligners. Duration: 45 minutes. Cost: Free. Complimentary consultation includes X-rays and treatment options.",
+    "Traditional Braces: Metal or ceramic braces for teeth alignment. Duration varies (12-24 months). Cost: $3000-$6000. Monthly adjustment visits included.",
+    "Clear Aligners (Invisalign): Invisible aligners for teeth straightening. Duration varies (6-18 months). Cost: $3500-$7000.",
+    "Emergency Visit: Same-day treatment for dental emergencies including pain, swelling, or trauma. Duration: 30 minutes. Cost: $100-$200 exam fee plus treatment.",
+    "Night Guard: Custom-fitted guard for teeth grinding (bruxism). Duration: 30 minutes (2 visits). Cost: $300-$500.",
+    "Dentures: Full or partial removable dentures. Duration: Multiple visits. Cost: $1000-$3000.",
+    "We accept most major dental insurance plans including Delta Dental, Cigna, MetLife, Aetna, Guardian, United Healthcare, and many others. We also accept Medicaid for children's dental services.",
+    "If we don't accept your insurance, we can still see you! We offer our Savings Plan and competitive self-pay rates. We'll provide a superbill for you to submit for potential reimbursement.",
+    "New patients should arrive 15 minutes early to complete paperwork. Bring your insurance card, ID, and list of current medications.",
+    "We offer early morning appointments starting at 7:30 AM at Christiana for patients who need to get to work.",
+    "We try to accommodate same-day emergency appointments. Call as early as possible and we'll do our best to fit you in.",
+    "We accept cash, all major credit cards (Visa, MasterCard, Amex, Discover), CareCredit, and personal checks.",
+    "We offer CareCredit financing with 0% interest options for 6-12 months on treatments over $500.",
+    "Payment is due at time of service. For extensive treatment plans, we can discuss payment arrangements.",
+    "We recommend dental checkups and cleanings every 6 months for most patients. Some patients with gum disease may need more frequent visits.",
+    "Yes, we see patients of all ages including children! Dr. Adeline specializes in pediatric care and is great with kids.",
+    "We offer sedation options including nitrous oxide (laughing gas) and oral sedation for anxious patients.",
+    "X-rays are taken based on individual needs. New patients typically need a full set, then bitewings annually. We use digital X-rays which have 80% less radiation than traditional X-rays.",
+]
+
+# Ids match vector_index.py's default ids for a plain list of chunks
+knowledge = KnowledgeBase(snapshot=Snapshot([f"chunk_{i}" for i in range(len(RAG_CHUNKS))], RAG_CHUNKS,
+                                            SERVICE_DURATIONS, LOCATIONS, PROVIDERS))
+
+def current_extractor():
+    return knowledge.current().extractor
+
+def new_session():
+    return Session(current_extractor)
+
+def retrieve(query, session=None, kb=None):
+    # Ranked (chunk id, text) pairs
+    kb = kb or knowledge.current()
+    with tracing.span("retrieval"):
+        # The session's last message is the query, already extracted when it was added
+        terms = session.recent_keywords() if session is not None else kb.extractor.extract(query).keywords
+        ids = [kb.ids[i] for i, _ in kb.index.search_terms(terms, k=10)]
+    if vector_index is not None:
+        with tracing.span("vector_search"):
+            # The index is built offline and outlives reloads: keep only chunks this snapshot still has
+            semantic = [vector_index.ids[row] for row, _ in vector_index.search([query], k=10)[0]
+                        if vector_index.ids[row] in kb.rows]
+        ids = reciprocal_rank_fusion([ids, semantic])[:10]
+    # Texts always come from the snapshot, so an edited chunk appears once, as it is now
+    hits = [(chunk_id, kb.chunks[kb.rows[chunk_id]]) for chunk_id in ids]
+    return hits or list(zip(kb.ids[:5], kb.chunks[:5]))
+
+def get_context(query, session=None):
+    return "\n".join([text for _, text in retrieve(query, session)])
+
+def get_available_slots(location=None, days_ahead=21, duration_minutes=60, max_staleness=None):
+    # Start times per office; no location means both offices, each listed with its own hours
+    with tracing.span("calendar_sync") as attrs:
+        synced_at = event_cache.synced_at
+        timelines = event_cache.timelines(max_staleness)
+        attrs["synced"] = event_cache.synced_at != synced_at
+        attrs["calendars"] = len(timelines)
+        attrs["events"] = sum(len(timeline.periods) for timeline in timelines.values())
+    with tracing.span("slot_search") as attrs:
+        slots = scheduler.available_by_location(duration_minutes, location, days_ahead)
+        attrs["slots"] = sum(len(starts) for starts in slots.values())
+    return slots
+
+def book_appointment(slot_time, patient_name, service_type, location, duration_minutes):
+    event = {
+        'summary': f'{service_type} - {patient_name}',
+        'description': f'Patient: {patient_name}\nService: {service_type}\nLocation: {location}\nDuration: {duration_minutes} minutes',
+        'start': {
+            'dateTime': slot_time.isoformat(),
+            'timeZone': 'US/Eastern',
+        },
+        'end': {
+            'dateTime': (slot_time + timedelta(minutes=duration_minutes)).isoformat(),
+            'timeZone': 'US/Eastern',
+        },
+    }
+    
+    with tracing.span("calendar_insert"):
+        event = scheduler.book(slot_time, location, duration_minutes, event)
+    return event
+
+def is_calendar_error(error):
+    # googleapiclient's HttpError carries the response in .resp; network failures are OSErrors
+    return isinstance(error, OSError) or hasattr(error, "resp")
+
+def parse_and_book(response_text, session=None, kb=None):
+    kb = kb or knowledge.current()
+    booking = kb.extractor.booking(response_text, datetime.now(est).date())
+    if booking is None:
+        return response_text
+    name = booking.name
+    # Validate name
+    invalid_names = ['yes', 'no', 'confirm', 'ok', 'okay', 'sure', 'yep', 'yeah', 'book', 'it']
+    if name.lower() in invalid_names or len(name) < 2:
+        return response_text.replace(booking.line, "I'd be happy to book that for you! Could you please provide your full name?")
+    if booking.day is None:
+        # Never show the raw BOOKED line: ask for a day the calendar can be checked for
+        return response_text.replace(booking.line, "Which day works best for you?")
+    if booking.time is None:
+        # Never guess: without a time the earliest opening would be booked silently
+        return response_text.replace(booking.line,
+            f"What time on {booking.day.strftime('%A, %b %d')} works best for you?")
+    try:
+        service = booking.service
+        loc = booking.location
+        day = booking.day
+        dur = get_duration(service, kb)
+    
+        # Always pick up external changes before booking; only that day is recomputed
+        with tracing.span("slot_lookup"):
+            openings = scheduler.day_openings(day, dur, loc, max_staleness=0)
+        exact = est.localize(datetime(day.year, day.month, day.day, *booking.time))
+        # The prompt lists ranges, so an off-grid time gets the nearest opening that day
+        candidates = [exact] if exact in openings else []
+        target_minutes = exact.hour * 60 + exact.minute
+        candidates += sorted((slot for slot in openings if slot != exact),
+                             key=lambda s: abs(s.hour * 60 + s.minute - target_minutes))
+    
+        for slot in candidates:
+            try:
+                book_appointment(slot, name, service, loc, dur)
+            except SlotTaken:
+                # Another conversation got there first; try the next closest
+                continue
+            adjusted = " (adjusted to fit schedule)" if slot != exact else ""
+            return response_text.replace(booking.line,
+                f"✅ Appointment booked: {name} for {service} at {loc}, {slot.strftime('%A, %b %d at %I:%M %p')}{adjusted}")
+    
+        return response_text.replace(booking.line,
+            f"Sorry, {day.strftime('%A, %b %d')} at {loc} is fully booked now. Would another day work for you?")
+                
+    except Exception as e:
+        # Calendar outages and quota errors; anything else is a bug and fails the turn
+        if not is_calendar_error(e):
+            raise
+        tracing.log_error("booking failed", e)
+        tracing.annotate(booking_error=type(e).__name__)
+        return response_text.replace(booking.line,
+            "Sorry, I couldn't complete the booking just now. Could you try again in a moment?")
+
+@tracing.tracer.turn()
+def agent(user_message, session, on_token=None):
+    # The caller has already added user_message to the session. A knowledge-base
+    # reload mid-turn does not affect this turn: it keeps the snapshot it started with
+    kb = knowledge.current()
+    service_type = session.service or "cleaning"
+    duration = get_duration(service_type, kb)
+    location = session.location
+    
+    # FAQ-only conversations skip the calendar and may be answered from cache
+    scheduling = session.scheduling
+    if scheduling:
+        # The calendar fetch is network-bound; retrieve context while it runs
+        slots_future = executor.submit(tracing.bind(get_available_slots), location=location, duration_minutes=duration)
+    else:
+        answer_cache.skipped_calendar_fetch()
+    tracing.annotate(scheduling=scheduling, service=service_type, location=location)
+    hits = retrieve(user_message, session, kb)
+    context = "\n".join([text for _, text in hits])
+    
+    cache_key = None
+    # Only a conversation's opening message is answered from (and into) the
+    # shared cache: later replies can carry this patient's name and details
+    if not scheduling and len(session.messages) == 1 and not session.dropped:
+        cache_key = answer_cache.key(user_message, [chunk_id for chunk_id, _ in hits])
+        cached = answer_cache.get(cache_key)
+        tracing.annotate(cache_hit=cached is not None)
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            return cached
+    
+    now = datetime.now(est)
+    if scheduling:
+        dates, hours = session.requested_window(now)
+        # Only the part of the calendar fetch that retrieval did not hide
+        with tracing.span("calendar_wait"):
+            slots = slots_future.result()
+        tracing.annotate(slots=sum(len(starts) for starts in slots.values()))
+        availability = render_availability(slots, dates, hours)
+    else:
+        availability = "Not loaded for this question. If the patient wants to book, ask which service, location and day suit them."
+    
+    system_prompt = f"""You are a friendly scheduling assistant for Avalon Dental.
+TODAY'S DATE: {now.strftime('%A, %B %d, %Y')}
+
+You for Avalon Dental. 
+You help patients with questions and booking appointments.
+
+OFFICE INFORMATION:
+{context}
+
+SERVICE BEING SCHEDULED: {service_type} ({duration} minutes)
+
+AVAILABLE APPOINTMENTS (next 3 weeks):
+{availability}
+
+LOCATIONS:
+{describe_hours(kb.locations)}
+
+IMPORTANT: We can only schedule appointments up to 3 weeks in advance. If someone asks for a date beyond 3 weeks, let them know and offer the latest available dates.
+
+RULES:
+- Always ask which location ({' or '.join(kb.locations)}) when scheduling
+- Be friendly and concise  
+- If asked about a specific date, check if it's Mon-Thu (open) or Fri-Sun (closed)
+- IMPORTANT: You MUST collect the patient's full name BEFORE booking. Never book without a name.
+- Only output BOOKED: AFTER you have the patient's name AND they explicitly confirm with "yes", "confirm", "book it", "that works", "sounds good", etc.
+- Do NOT output BOOKED: when just asking for their name or confirming details - wait for explicit confirmation
+- When patient confirms, respond with EXACTLY this format on its own line:
+  BOOKED: [name], [service], [location], [day, month date, year at time]
+  Example: BOOKED: John Smith, Cleaning, Newport, Tuesday, Dec 16, 2025 at 08:00 AM
+"""
+    
+    # Newest turns first until the budget is spent; whatever is left out is
+    # still represented by the facts the session derived from it
+    history, omitted = session.window(PROMPT_HISTORY_TOKENS * 4)
+    tracing.annotate(history_messages=len(history), history_omitted=omitted)
+    messages = system_prompt + "\n\nConversation:\n"
+    if omitted:
+        messages += f"(Earlier in this conversation: {session.facts() or 'nothing to note'})\n"
+    messages += "".join(history)
+    messages += f"Patient: {user_message}\n\nRespond with ONE message only. Do not simulate future conversation turns. Do not write 'Patient:' in your response.\n\nAssistant:"
+    
+    tracing.annotate(prompt_chars=len(messages), prompt_tokens=len(messages) // 4)
+    
+    started = time.monotonic()
+    response_text = ""
+    with tracing.span("llm") as attrs:
+        for chunk in gemini.generate_content(messages, stream=True):
+            response_text += chunk.text
+            attrs.setdefault("first_token_ms", round((time.monotonic() - started) * 1000, 2))
+            if on_token:
+                on_token(response_text)
+        attrs["response_chars"] = len(response_text)
+    
+    if "BOOKED:" in response_text:
+        with tracing.span("booking"):
+            response_text = parse_and_book(response_text, session, kb)
+        tracing.annotate(booked="Appointment booked" in response_text)
+    if cache_key is not None and "BOOKED:" not in response_text:
+        answer_cache.put(cache_key, response_text, time.monotonic() - started)
+    
+    return response_text
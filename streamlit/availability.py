@@ -0,0 +1,195 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from math import gcd
+from dateutil import parser as date_parser
+
+SLOT_STEP_MINUTES = 15
+WORK_DAYS = [0, 1, 2, 3]
+
+
+def parse_busy_periods(events, tz):
+    busy_periods = []
+    for event in events:
+        start_raw = event['start'].get('dateTime', event['start'].get('date'))
+        end_raw = event['end'].get('dateTime', event['end'].get('date'))
+
+        if 'T' in start_raw:
+            busy_periods.append((date_parser.parse(start_raw), date_parser.parse(end_raw)))
+        else:
+            start_date = date_parser.parse(start_raw)
+            busy_periods.append((
+                tz.localize(datetime.combine(start_date, datetime.min.time())),
+                tz.localize(datetime.combine(start_date + timedelta(days=1), datetime.min.time()))
+            ))
+    return busy_periods
+
+
+def merge_busy_periods(busy_periods):
+    merged = []
+    # The Calendar API never returns events that end before they start
+    for start, end in sorted(p for p in busy_periods if p[0] <= p[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class BusyTimeline:
+    """Sorted, merged busy periods rendered onto per-day occupancy bitmaps.
+
+    Bit i of a day's bitmap covers [open + i*unit, open + (i+1)*unit). A slot
+    starting on a cell boundary is free when its window of cells is clear, which
+    matches the interval overlap test of the original nested loop exactly.
+    """
+
+    def __init__(self, busy_periods):
+        self.periods = merge_busy_periods(busy_periods)
+        self.ends = [end for _, end in self.periods]
+
+    def occupancy(self, open_dt, close_dt, unit):
+        # Returns (cells, points): cells marks partially or fully busy cells,
+        # points marks zero-length events sitting exactly on a cell boundary.
+        cells = 0
+        points = 0
+        n_cells = -((open_dt - close_dt) // unit)
+        i = bisect_right(self.ends, open_dt)
+        while i < len(self.periods):
+            busy_start, busy_end = self.periods[i]
+            if busy_start >= close_dt:
+                break
+            i += 1
+            first = (busy_start - open_dt) // unit
+            if busy_start == busy_end and (busy_start - open_dt) % unit == timedelta(0):
+                points |= 1 << first
+                continue
+            last = -((open_dt - busy_end) // unit)
+            if busy_start == busy_end:
+                last = first + 1
+            first = max(first, 0)
+            last = min(last, n_cells)
+            if last > first:
+                cells |= ((1 << (last - first)) - 1) << first
+        return cells, points
+
+    def is_free(self, start, end):
+        # Same overlap test as the slot search: start < busy_end and end > busy_start
+        i = bisect_right(self.ends, start)
+        return i == len(self.periods) or self.periods[i][0] >= end
+
+    def free_starts(self, open_dt, close_dt, duration_minutes, step_minutes=SLOT_STEP_MINUTES):
+        # Bitmask of cells where a slot of duration_minutes can start, plus the
+        # cell size. One sliding-window pass over the occupancy bitmap.
+        return self.free_starts_many(open_dt, close_dt, [duration_minutes], step_minutes)[duration_minutes]
+
+    def free_starts_many(self, open_dt, close_dt, durations, step_minutes=SLOT_STEP_MINUTES):
+        # free_starts for several durations from one occupancy bitmap, at the
+        # cell size that divides all of them: {duration: (starts, unit)}
+        unit_minutes = gcd(step_minutes, *durations) or step_minutes
+        unit = timedelta(minutes=unit_minutes)
+        step = step_minutes // unit_minutes
+        total = close_dt - open_dt
+        cells, points = self.occupancy(open_dt, close_dt, unit)
+
+        starts = {}
+        for duration_minutes in durations:
+            if total < timedelta(minutes=duration_minutes):
+                starts[duration_minutes] = 0, unit
+                continue
+            last_start = (total - timedelta(minutes=duration_minutes)) // unit
+            candidates = 0
+            for k in range(0, last_start + 1, step):
+                candidates |= 1 << k
+            blocked = cells
+            for i in range(1, duration_minutes // unit_minutes):
+                blocked |= cells >> i
+                blocked |= points >> i
+            starts[duration_minutes] = candidates & ~blocked, unit
+        return starts
+
+    def free_slots(self, start_date, days_ahead, open_time, close_time, duration_minutes, now, tz,
+                   work_days=WORK_DAYS, step_minutes=SLOT_STEP_MINUTES):
+        available = []
+        for day_offset in range(days_ahead):
+            check_date = start_date + timedelta(days=day_offset)
+            if check_date.weekday() not in work_days:
+                continue
+
+            open_dt = tz.localize(datetime.combine(check_date, open_time))
+            close_dt = tz.localize(datetime.combine(check_date, close_time))
+            starts, unit = self.free_starts(open_dt, close_dt, duration_minutes, step_minutes)
+            k = 0
+            while starts:
+                if starts & 1:
+                    slot_time = open_dt + k * unit
+                    if slot_time > now:
+                        available.append(slot_time)
+                starts >>= 1
+                k += 1
+        return available
+
+
+def _clock(slot):
+    return slot.strftime('%I:%M %p').lstrip('0')
+
+
+def compress_slots(slots, step_minutes=SLOT_STEP_MINUTES):
+    """Group slot start times into one line per day of consecutive ranges,
+    e.g. "Tuesday, Dec 16, 2025: 8:00 AM-11:15 AM, 1:00 PM"."""
+    step = timedelta(minutes=step_minutes)
+    lines = []
+    day = None
+    ranges = []
+    for slot in slots:
+        if slot.date() != day:
+            if ranges:
+                lines.append((day, ranges))
+            day, ranges = slot.date(), []
+        if ranges and slot - ranges[-1][1] == step:
+            ranges[-1][1] = slot
+        else:
+            ranges.append([slot, slot])
+    if ranges:
+        lines.append((day, ranges))
+    return [
+        ranges[0][0].strftime('%A, %b %d, %Y') + ": " + ", ".join(
+            _clock(start) if start == end else f"{_clock(start)}-{_clock(end)}" for start, end in ranges)
+        for day, ranges in lines
+    ]
+
+
+def render_availability(openings, dates=None, hours=None, max_tokens=600, step_minutes=SLOT_STEP_MINUTES):
+    """Availability for the system prompt: ranges of start times per location,
+    narrowed to the requested dates/part of day when that leaves any openings,
+    and cut off at roughly max_tokens (estimated at four characters per token),
+    shared evenly between the locations listed."""
+    narrowed = {name: [s for s in slots
+                       if (dates is None or s.date() in dates)
+                       and (hours is None or hours[0] <= s.hour < hours[1])]
+                for name, slots in openings.items()}
+    header = f"Start times every {step_minutes} minutes within each range."
+    if dates is not None or hours is not None:
+        if any(narrowed.values()):
+            header += " Showing only the dates/times the patient asked about."
+            openings = narrowed
+        else:
+            header += " Nothing is open at the time the patient asked about; these are the other openings."
+    if not any(openings.values()):
+        return "No openings in the next 3 weeks."
+
+    lines = [header]
+    budget = max_tokens * 4 / len(openings) - len(header)
+    for name, slots in openings.items():
+        # Merged, both offices would read as open from the earliest opening to the latest close
+        if len(openings) > 1:
+            lines.append(f"{name}:" if slots else f"{name}: no openings")
+        used = 0
+        day_lines = compress_slots(slots, step_minutes)
+        for i, line in enumerate(day_lines):
+            if used + len(line) + 1 > budget:
+                lines.append(f"(+{len(day_lines) - i} more days with openings; ask the patient which day suits them)")
+                break
+            lines.append(line)
+            used += len(line) + 1
+    return "\n".join(lines)
@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from availability import BusyTimeline, parse_busy_periods
+
+
+class EventCache:
+    """Process-wide copy of one calendar's events, kept current with sync tokens.
+
+    The first sync lists events from `lookback_days` ago to `days_ahead`
+    plus `margin_days` ahead; later syncs send the stored sync token and only
+    receive changed or cancelled events, of which those past the window are
+    dropped. Once `days_ahead` reaches past the window, the next sync is a
+    full one over a new window. Reads within `max_staleness` seconds of the
+    last sync never touch the network, and inserts go through the cache so
+    the new event is visible immediately. Listeners are called with (calendar id, changed busy
+    periods) after every change, or None in place of the periods when the
+    whole calendar was reloaded.
+    """
+
+    def __init__(self, calendar_service, calendar_id, tz, max_staleness=60, lookback_days=1, days_ahead=22,
+                 margin_days=7):
+        self.calendar_service = calendar_service
+        self.calendar_id = calendar_id
+        self.calendar_ids = [calendar_id]
+        self.tz = tz
+        self.max_staleness = max_staleness
+        self.lookback_days = lookback_days
+        self.days_ahead = days_ahead
+        self.margin_days = margin_days
+        self.window_end = None
+        self.busy_periods = {}
+        self.sync_token = None
+        self.synced_at = None
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self._timeline = None
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def _list_pages(self, **params):
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+            result = self.calendar_service.events().list(
+                calendarId=self.calendar_id, singleEvents=True, **params).execute()
+            yield result
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _full_sync(self):
+        now = datetime.now(self.tz)
+        time_min = now - timedelta(days=self.lookback_days)
+        time_max = now + timedelta(days=self.days_ahead + self.margin_days)
+        busy_periods = {}
+        sync_token = None
+        for page in self._list_pages(timeMin=time_min.isoformat(), timeMax=time_max.isoformat()):
+            for event in page.get('items', []):
+                if event.get('status') != 'cancelled':
+                    busy_periods[event['id']] = parse_busy_periods([event], self.tz)[0]
+            sync_token = page.get('nextSyncToken', sync_token)
+        self.busy_periods = busy_periods
+        self.sync_token = sync_token
+        self.window_end = time_max
+        self.full_syncs += 1
+        return None
+
+    def _incremental_sync(self):
+        busy_periods = dict(self.busy_periods)
+        sync_token = self.sync_token
+        changed = []
+        for page in self._list_pages(syncToken=self.sync_token):
+            for event in page.get('items', []):
+                old = busy_periods.pop(event['id'], None)
+                if old is not None:
+                    changed.append(old)
+                if event.get('status') == 'cancelled':
+                    continue
+                # The sync token reports changes anywhere on the calendar; keep the window's
+                period = parse_busy_periods([event], self.tz)[0]
+                if period[0] < self.window_end:
+                    busy_periods[event['id']] = period
+                    changed.append(period)
+            sync_token = page.get('nextSyncToken', sync_token)
+        self.busy_periods = busy_periods
+        self.sync_token = sync_token
+        self.incremental_syncs += 1
+        return changed
+
+    def _sync(self):
+        if self.sync_token is None or datetime.now(self.tz) + timedelta(days=self.days_ahead) > self.window_end:
+            changed = self._full_sync()
+        else:
+            try:
+                changed = self._incremental_sync()
+            except Exception as e:
+                # 410 Gone: the sync token expired, start over with a full sync
+                if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                    raise
+                self.sync_token = None
+                changed = self._full_sync()
+        self.synced_at = time.monotonic()
+        if changed != []:
+            self._timeline = None
+            self._notify(changed)
+
+    def _notify(self, changed):
+        for listener in self.listeners:
+            listener(self.calendar_id, changed)
+
+    def refresh(self, max_staleness=None):
+        if max_staleness is None:
+            max_staleness = self.max_staleness
+        with self._lock:
+            if self.synced_at is None or time.monotonic() - self.synced_at >= max_staleness:
+                self._sync()
+
+    def timeline(self, max_staleness=None):
+        self.refresh(max_staleness)
+        with self._lock:
+            if self._timeline is None:
+                self._timeline = BusyTimeline(self.busy_periods.values())
+            return self._timeline
+
+    def timelines(self, max_staleness=None):
+        # Same shape as FreeBusyCache.timelines, for the Scheduler
+        return {self.calendar_id: self.timeline(max_staleness)}
+
+    def insert(self, body, calendar_id=None):
+        event = self.calendar_service.events().insert(
+            calendarId=self.calendar_id, body=body).execute()
+        with self._lock:
+            self.busy_periods = dict(self.busy_periods)
+            self.busy_periods[event['id']] = parse_busy_periods([event], self.tz)[0]
+            self._timeline = None
+            self._notify([self.busy_periods[event['id']]])
+        return event
@@ -0,0 +1,277 @@
+import re
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from retrieval import STOP_WORDS, stem
+
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTH_NUMBERS = {m: i + 1 for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+# Month names and their standard abbreviations ("sept" too), never any word that starts like one
+MONTH_PATTERN = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+                 r"|sep(?:t|tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+PARTS_OF_DAY = {"morning": (0, 12), "afternoon": (12, 17), "evening": (17, 24)}
+SCHEDULING_WORDS = [r"schedul\w*", r"book\w*", r"appointments?", r"appts?", r"availab\w*", r"openings?",
+                    r"slots?", "come in", "fit me in", r"reschedul\w*", "sooner", "earliest", r"confirm\w*"]
+NAME_INTROS = ["my name is", "name's", "this is", "i am", "i'm"]
+
+# One date expression: a month and day in any common order (year only when written), a day of the
+# month alone ("the 16th"), a weekday, or today/tomorrow/this week/next week
+DateMention = namedtuple("DateMention", "text month day year weekday relative")
+
+# A time as the model writes it in a BOOKED line: 2:30 PM, 9am, 14:30, noon, or a bare hour after "at"
+CLOCK_RE = re.compile(r"\b(?:(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>[ap])\.?\s?m\b\.?"
+                      r"|(?P<hour24>\d{1,2}):(?P<minute24>\d{2})\b"
+                      r"|(?P<named>noon|midnight)\b"
+                      r"|at\s+(?P<bare>\d{1,2})\b(?!\s*(?:[:/]|[ap]\.?\s?m\b)))", re.I)
+# No office opens before 7:30, so "at 2:30" or "at 5" without AM/PM is afternoon
+EARLIEST_MORNING_HOUR = 7
+
+BOOKED_RE = re.compile(r"^.*?BOOKED:\s*(?P<name>[^,\n]*)"
+                       r"(?:,\s*(?P<service>[^,\n]*),\s*(?P<location>[^,\n]*),\s*(?P<when>[^\n]*))?.*$", re.M)
+
+
+@dataclass
+class Entities:
+    """What one message mentions. Services and locations are in table order
+    (the first is the one to use), except that a service the message names
+    comes before one only found inside it; dates, times and providers in
+    text order."""
+
+    services: list = field(default_factory=list)
+    locations: list = field(default_factory=list)
+    providers: list = field(default_factory=list)
+    dates: list = field(default_factory=list)
+    times: list = field(default_factory=list)
+    hours: tuple = None
+    scheduling: bool = False
+    patient_name: str = None
+    keywords: list = field(default_factory=list)
+
+
+@dataclass
+class Booking:
+    """A BOOKED: line. service/location/day/time are None when the line is
+    incomplete or names no date; `line` is the full line, for replacing."""
+
+    line: str
+    name: str
+    service: str = None
+    location: str = None
+    day: date = None
+    time: tuple = None
+
+
+WORD_RE = re.compile(r"[a-z0-9]+", re.I)
+
+
+def _alternation(words):
+    # Longest first, so "braces consultation" wins over "consultation"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+def _key(word):
+    # Trigger key of a lowercased word: its first three letters, or "#" for a number
+    return word[:3] if word[0] > "9" else "#"
+
+
+class EntityExtractor:
+    """Single-pass extraction of everything a message says that the agent uses.
+
+    Built from the service, location and provider tables and the retrieval
+    stop words. One scan splits the message into words; each word becomes a
+    BM25 keyword (so retrieval does not tokenize it again) and is looked up
+    by its first three letters in a table of the entities that can start
+    there. Only then is that entity's compiled pattern matched, anchored at
+    the word, so plain words cost one dict lookup. Services are found where
+    a word starts, and a service that contains another ("braces
+    consultation") reports both, the longer one first.
+    `service_aliases` maps a service to other names it goes by ("implant"
+    for "dental implant placement"); they report the service itself.
+    """
+
+    def __init__(self, services=(), locations=(), providers=None, stop_words=STOP_WORDS, service_aliases=None):
+        self.services = list(services)
+        self.locations = list(locations)
+        self.stop_words = stop_words
+        # Matched text -> (the service it names, every service it contains)
+        self._services = {s.lower(): (s, {t for t in self.services if t.lower() in s.lower()}) for s in self.services}
+        for service, aliases in (service_aliases or {}).items():
+            for alias in aliases:
+                self._services.setdefault(alias.lower(), (service, {service}))
+        self._locations = {l.lower(): l for l in self.locations}
+        self._providers = {alias.lower(): name for name, aliases in (providers or {}).items() for alias in aliases}
+
+        self._patterns = {}
+        self._triggers = {}
+
+        def add(kind, pattern, starts):
+            self._patterns[kind] = re.compile(pattern, re.I)
+            for start in starts:
+                kinds = self._triggers.setdefault(_key(WORD_RE.match(start).group().lower()), [])
+                if kind not in kinds:
+                    kinds.append(kind)
+
+        add("name", r"\b(?:" + "|".join(NAME_INTROS) + r")\s+(?P<patient>(?-i:[A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)+))",
+            NAME_INTROS)
+        if self._services:
+            add("service", r"\b(?:" + _alternation(self._services) + ")", self._services)
+        if self._locations:
+            add("location", r"\b(?:" + _alternation(self._locations) + r")\b", self._locations)
+        if self._providers:
+            add("provider", r"\b(?:dr\.?\s+)?(?P<alias>" + _alternation(self._providers) + r")\b",
+                ["dr"] + list(self._providers))
+        add("date", r"\b(?:(?P<month>" + MONTH_PATTERN + r")\b\.?\s+(?P<mday>\d{1,2})(?:st|nd|rd|th)?"
+            r"(?:,?\s+(?P<year>\d{4}))?"
+            r"|(?P<iyear>\d{4})-(?P<imonth>\d{1,2})-(?P<iday>\d{1,2})"
+            r"|(?P<dday>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<dmonth>" + MONTH_PATTERN + r")\b\.?"
+            r"(?:,?\s+(?P<dyear>\d{4}))?"
+            r"|(?P<mnum>\d{1,2})/(?P<dnum>\d{1,2})"
+            r"|(?<=\bthe )(?P<oday>\d{1,2})(?:st|nd|rd|th))\b"
+            r"|\b(?P<weekday>" + "|".join(WEEKDAY_NAMES) + r")s?\b"
+            r"|\b(?P<relative>today|tomorrow|this week|next week)\b",
+            list(MONTH_NUMBERS) + WEEKDAY_NAMES + ["today", "tomorrow", "this", "next", "0"])
+        add("time", r"\b(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)\b", ["0"])
+        add("part", r"\b(?P<part>" + "|".join(PARTS_OF_DAY) + r")s?\b", PARTS_OF_DAY)
+        add("scheduling", r"\b(?:" + "|".join(SCHEDULING_WORDS) + r")\b",
+            SCHEDULING_WORDS)
+
+    def extract(self, text):
+        found = Entities()
+        services = set()
+        named = set()
+        locations = set()
+        keywords = found.keywords
+        stop_words = self.stop_words
+        triggers = self._triggers
+        # Where the last match of each kind ended; like one finditer per kind, matches do not overlap
+        ends = {}
+        for word_match in WORD_RE.finditer(text):
+            word = word_match.group().lower()
+            if len(word) > 2 and word not in stop_words:
+                keywords.append(stem(word))
+            kinds = triggers.get(word[:3] if word[0] > "9" else "#")
+            if kinds is None:
+                continue
+            start = word_match.start()
+            for kind in kinds:
+                if start < ends.get(kind, 0):
+                    continue
+                m = self._patterns[kind].match(text, start)
+                if m is None:
+                    continue
+                ends[kind] = m.end()
+                if kind == "service":
+                    service, contained = self._services[m.group().lower()]
+                    named.add(service)
+                    services |= contained
+                elif kind == "location":
+                    locations.add(self._locations[m.group().lower()])
+                elif kind == "provider":
+                    found.providers.append(self._providers[m.group("alias").lower()])
+                elif kind == "name":
+                    found.patient_name = found.patient_name or m.group("patient")
+                elif kind == "date":
+                    found.scheduling = True
+                    found.dates.append(_date_mention(m))
+                elif kind == "time":
+                    found.scheduling = True
+                    hour = int(m.group("hour")) % 12 + (12 if m.group("ampm").lower() == "pm" else 0)
+                    found.times.append((hour, int(m.group("minute") or 0)))
+                elif kind == "part":
+                    found.scheduling = True
+                    found.hours = found.hours or PARTS_OF_DAY[m.group("part").lower()]
+                else:
+                    found.scheduling = True
+        # "deep cleaning" is a deep cleaning first, and a cleaning only after that
+        found.services = sorted((s for s in self.services if s in services), key=lambda s: s not in named)
+        found.locations = [l for l in self.locations if l in locations]
+        return found
+
+    def booking(self, text, today, days_ahead=21):
+        m = BOOKED_RE.search(text)
+        if m is None:
+            return None
+        booking = Booking(m.group(0), m.group("name").strip())
+        if m.group("when") is None:
+            return booking
+        booking.service = m.group("service").strip()
+        location = m.group("location").strip()
+        booking.location = (self.extract(location).locations or [location])[0]
+        when = self.extract(m.group("when"))
+        # An explicit month and day wins over the weekday or bare day of the month written beside it
+        mentions = sorted(when.dates, key=lambda d: (d.month is None, d.day is None))
+        if mentions:
+            booking.day = min(resolve_dates(mentions[:1], today, days_ahead, every_week=False), default=None)
+        booking.time = clock_time(m.group("when"))
+        return booking
+
+
+def _date_mention(m):
+    month = m.group("month") or m.group("dmonth")
+    if month:
+        month = MONTH_NUMBERS[month[:3].lower()]
+    elif m.group("imonth") or m.group("mnum"):
+        month = int(m.group("imonth") or m.group("mnum"))
+    day = m.group("mday") or m.group("dday") or m.group("iday") or m.group("dnum") or m.group("oday")
+    year = m.group("year") or m.group("dyear") or m.group("iyear")
+    return DateMention(
+        m.group(), month, int(day) if day else None, int(year) if year else None,
+        WEEKDAY_NAMES.index(m.group("weekday").lower()) if m.group("weekday") else None,
+        m.group("relative").lower() if m.group("relative") else None)
+
+
+def clock_time(text):
+    # (hour, minute) of the first time in text, or None
+    for m in CLOCK_RE.finditer(text):
+        if m.group("named"):
+            return (12, 0) if m.group("named").lower() == "noon" else (0, 0)
+        hour = int(m.group("hour") or m.group("hour24") or m.group("bare"))
+        minute = int(m.group("minute") or m.group("minute24") or 0)
+        if m.group("ampm"):
+            if not 1 <= hour <= 12:
+                continue
+            hour = hour % 12 + (12 if m.group("ampm").lower() == "p" else 0)
+        elif 0 < hour < EARLIEST_MORNING_HOUR:
+            hour += 12
+        if hour < 24 and minute < 60:
+            return hour, minute
+    return None
+
+
+def resolve_dates(mentions, today, days_ahead=21, every_week=True):
+    # Calendar dates for date mentions; a weekday means each one in the
+    # window, or only the next one with every_week=False
+    dates = set()
+    for mention in mentions:
+        try:
+            if mention.month:
+                if mention.year:
+                    dates.add(date(mention.year, mention.month, mention.day))
+                    continue
+                target = today.replace(month=mention.month, day=mention.day)
+                if target < today:
+                    target = target.replace(year=today.year + 1)
+                dates.add(target)
+            elif mention.day:
+                # "the 16th": the next one, this month or the first later month that has it
+                following = (today + timedelta(days=d) for d in range(62))
+                target = next((d for d in following if d.day == mention.day), None)
+                if target:
+                    dates.add(target)
+            elif mention.weekday is not None:
+                offset = (mention.weekday - today.weekday()) % 7
+                dates.update(today + timedelta(days=d) for d in range(offset, days_ahead if every_week else offset + 1, 7))
+            elif mention.relative == "today":
+                dates.add(today)
+            elif mention.relative == "tomorrow":
+                dates.add(today + timedelta(days=1))
+            else:
+                monday = today - timedelta(days=today.weekday())
+                if mention.relative == "next week":
+                    monday += timedelta(days=7)
+                dates.update(monday + timedelta(days=d) for d in range(7))
+        except ValueError:
+            continue
+    return dates
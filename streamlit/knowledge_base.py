@@ -0,0 +1,336 @@
+"""Knowledge base compiled from JSON into one snapshot file, with hot reload.
+
+A data directory holds the sources used by notebooks 01/02:
+office_info.json, providers.json, services.json and faqs.json.
+compile_snapshot() turns them into everything the agent reads:
+- chunk ids and texts, worded as in notebook 02;
+- service durations;
+- location hours, in the scheduler's format;
+- service and provider aliases;
+- the BM25 index.
+save_snapshot() pickles the result into a single file, written atomically.
+load_snapshot() reads it back in one read, with nothing to parse or index.
+KnowledgeBase serves the current snapshot. When the sources change it
+compiles a new one and swaps it in. A turn keeps the snapshot it started
+with, so conversations in flight are never dropped.
+
+Build offline (KnowledgeBase also rebuilds a missing or stale snapshot):
+
+    python knowledge_base.py data knowledge.snapshot
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+
+import tracing
+from entities import WEEKDAY_NAMES, EntityExtractor
+from retrieval import InvertedIndex
+
+SOURCES = ["office_info.json", "providers.json", "services.json", "faqs.json"]
+SNAPSHOT_FORMAT = 2
+
+# Dropped from a service's name for its short alias: "Dental Implant Placement" is an "implant"
+GENERIC_SERVICE_WORDS = {"dental", "teeth", "tooth", "visit", "placement", "treatment", "procedure", "appointment"}
+HOURS_RE = re.compile(r"(\d{1,2}):(\d{2})\s*([ap])\.?m\.?\s*-\s*(\d{1,2}):(\d{2})\s*([ap])\.?m\.?", re.I)
+
+
+class Snapshot:
+    """One version of the knowledge base. Never modified once built; a
+    reload builds a new one."""
+
+    def __init__(self, ids, chunks, service_durations, locations, providers=None, digest=None, index=None,
+                 service_aliases=None):
+        self.ids = list(ids)
+        self.chunks = list(chunks)
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.service_durations = dict(service_durations)
+        self.locations = dict(locations)
+        self.providers = dict(providers or {})
+        self.service_aliases = dict(service_aliases or {})
+        self.digest = digest
+        self.index = index or InvertedIndex(self.chunks)
+        self.extractor = EntityExtractor(self.service_durations, self.locations, self.providers,
+                                         service_aliases=self.service_aliases)
+
+
+def _clock(hour, minute, half):
+    return hour % 12 + (12 if half.lower() == "p" else 0), minute
+
+
+def _days(label):
+    # "Monday", "Mon-Thu" or "Monday-Thursday" -> weekday numbers
+    ends = [[i for i, day in enumerate(WEEKDAY_NAMES) if day[:3] == part.strip().lower()[:3]]
+            for part in label.split("-")]
+    if not all(ends):
+        raise ValueError(f"unknown day in {label!r}")
+    return list(range(ends[0][0], ends[-1][0] + 1))
+
+
+def _location_hours(location):
+    # The scheduler takes one open and close time per location
+    hours = set()
+    days = []
+    for label, text in location["hours"].items():
+        match = HOURS_RE.search(text)
+        if match is None:
+            continue
+        hours.add((_clock(*map(int, match.group(1, 2)), match.group(3)),
+                   _clock(*map(int, match.group(4, 5)), match.group(6))))
+        days += _days(label)
+    if len(hours) != 1:
+        raise ValueError(f"{location['name']}: expected the same hours on every open day, got {sorted(hours)}")
+    (open_time, close_time), = hours
+    return {"open": open_time, "close": close_time, "days": sorted(set(days))}
+
+
+def _provider_aliases(providers):
+    # First name, full name without the title, and the last name when no other provider shares it
+    names = {p["name"]: re.sub(r"^dr\.?\s+", "", p["name"], flags=re.I).lower().split() for p in providers}
+    last_names = [parts[-1] for parts in names.values()]
+    aliases = {}
+    for p in providers:
+        parts = names[p["name"]]
+        aliases[p["name"]] = p.get("aliases") or (
+            [parts[0], " ".join(parts)] + ([parts[-1]] if last_names.count(parts[-1]) == 1 else []))
+    return aliases
+
+
+def _service_aliases(services):
+    # The id, the parenthesized name and the name without generic words, unless
+    # another service is called that or derives the same alias
+    keys = {s["id"]: re.sub(r"\s*\(.*?\)", "", s["name"]).lower() for s in services}
+    derived = {}
+    for s in services:
+        name = s["name"].lower()
+        words = re.sub(r"\(.*?\)", "", name).split()
+        derived[s["id"]] = s.get("aliases") or list(dict.fromkeys(
+            [s["id"].replace("_", " ").lower()] + re.findall(r"\((.*?)\)", name)
+            + [" ".join(w for w in words if w not in GENERIC_SERVICE_WORDS)]))
+    counts = {}
+    for aliases in derived.values():
+        for alias in aliases:
+            counts[alias] = counts.get(alias, 0) + 1
+    taken = set(keys.values())
+    return {keys[service_id]: [a for a in aliases if a and a not in taken and counts[a] == 1]
+            for service_id, aliases in derived.items()}
+
+
+def compile_snapshot(sources, digest=None):
+    """Build a Snapshot from the four parsed JSON documents, keyed by file name."""
+    office_info = sources["office_info.json"]
+    ids = []
+    chunks = []
+
+    def add(chunk_id, text):
+        ids.append(chunk_id)
+        chunks.append(text)
+
+    locations = {}
+    for loc in office_info["locations"]:
+        hours_text = ", ".join([f"{day}: {time}" for day, time in loc["hours"].items()])
+        add(f"location_{loc['name'].lower().replace(' ', '_')}",
+            f"{loc['name']} is located at {loc['address']}, {loc['city']}, {loc['state']} {loc['zip']}. "
+            f"Phone: {loc['phone']}. Hours: {hours_text}")
+        # "Avalon Dental Newport" is booked as "Newport"
+        locations[loc.get("short_name") or loc["name"].split()[-1]] = _location_hours(loc)
+    contact = office_info["contact"]
+    add("contact_info", f"Contact Avalon Dental by phone at {contact['main_phone']}, text at "
+                        f"{contact['text_number']} (preferred), or email at {contact['email']}.")
+    add("cancellation_policy", f"Avalon Dental requires {office_info['cancellation_policy']['notice_required_days']} "
+                               f"days notice for cancellations.")
+    plan = office_info["savings_plan"]
+    add("savings_plan", f"The {plan['name']} costs ${plan['enrollment_fee']} to enroll. "
+                        f"Benefits: {'. '.join(plan['benefits'])}. {plan['terms']}")
+
+    providers = sources["providers.json"]["providers"]
+    for p in providers:
+        add(p["id"], f"{p['name']} ({p['credentials']}) specializes in {', '.join(p['specialties'])}. {p.get('bio', '')}")
+
+    services = sources["services.json"]["services"]
+    service_durations = {}
+    for s in services:
+        price = f"${s['price_range']['min']}-${s['price_range']['max']}"
+        add(s["id"], f"{s['name']}: {s['description']}. Duration: {s['duration_minutes']} minutes. "
+                     f"Cost: {price}. {s.get('notes', '')}")
+        # "Deep Cleaning (Scaling and Root Planing)" is matched as "deep cleaning"
+        service_durations[re.sub(r"\s*\(.*?\)", "", s["name"]).lower()] = s["duration_minutes"]
+
+    for i, faq in enumerate(sources["faqs.json"]["faqs"]):
+        add(f"faq_{i}", f"Q: {faq['question']} A: {faq['answer']}")
+
+    return Snapshot(ids, chunks, service_durations, locations, _provider_aliases(providers), digest,
+                    service_aliases=_service_aliases(services))
+
+
+def _format_clock(clock):
+    hour, minute = clock
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def describe_hours(locations):
+    # Prompt lines, e.g. "- Newport: Mon-Thu 8:00 AM - 5:00 PM (OPEN Monday, Tuesday, Wednesday, Thursday)"
+    lines = []
+    for name, hours in locations.items():
+        days = [WEEKDAY_NAMES[d].title() for d in hours["days"]]
+        if len(days) > 1 and hours["days"] == list(range(hours["days"][0], hours["days"][-1] + 1)):
+            span = f"{days[0][:3]}-{days[-1][:3]}"
+        else:
+            span = ", ".join(day[:3] for day in days)
+        lines.append(f"- {name}: {span} {_format_clock(hours['open'])} - {_format_clock(hours['close'])} "
+                     f"(OPEN {', '.join(days)})")
+    return "\n".join(lines)
+
+
+def _read_bytes(data_dir):
+    # Each source's raw bytes and a digest of them, with no JSON parsing
+    digest = hashlib.sha256()
+    raw = {}
+    for name in SOURCES:
+        with open(os.path.join(data_dir, name), "rb") as f:
+            raw[name] = f.read()
+        digest.update(name.encode() + b"\0" + raw[name] + b"\0")
+    return raw, digest.hexdigest()
+
+
+def read_sources(data_dir):
+    # The parsed documents and a digest of their bytes
+    raw, digest = _read_bytes(data_dir)
+    return {name: json.loads(data) for name, data in raw.items()}, digest
+
+
+def save_snapshot(snapshot, path):
+    state = {"format": SNAPSHOT_FORMAT, "ids": snapshot.ids, "chunks": snapshot.chunks,
+             "service_durations": snapshot.service_durations, "locations": snapshot.locations,
+             "providers": snapshot.providers, "digest": snapshot.digest, "index": snapshot.index,
+             "service_aliases": snapshot.service_aliases}
+    # Readers (other processes included) see the old file or the new one, never part of one
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    # Only load snapshots this deployment wrote: unpickling runs code
+    with open(path, "rb") as f:
+        state = pickle.loads(f.read())
+    if state.pop("format", None) != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a format {SNAPSHOT_FORMAT} knowledge-base snapshot")
+    return Snapshot(**state)
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class KnowledgeBase:
+    """The current Snapshot, swapped for a new one when the sources change.
+
+    With no `data_dir` it serves `snapshot` forever. Otherwise current()
+    stats the sources at most every `check_interval` seconds. When they
+    have changed, one caller compiles the new snapshot while the others keep
+    getting the old one; it is then swapped in with a single assignment and
+    `listeners` are called with it. A source that fails to parse (e.g.
+    caught mid-edit) keeps the old snapshot and is retried at the next
+    check. A snapshot file whose digest matches the sources is loaded
+    instead of compiling; a stale one is rewritten.
+    """
+
+    def __init__(self, data_dir=None, snapshot_path=None, check_interval=5, snapshot=None, metrics=None):
+        self.data_dir = data_dir
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self.metrics = metrics or tracing.tracer.metrics
+        self.listeners = []
+        self.reloads = 0
+        self.last_error = None
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self.snapshot = snapshot
+        if data_dir is None:
+            return
+        self._stamp = self._stat_sources()
+        self.snapshot = self._build()
+
+    def _stat_sources(self):
+        return [_stat(os.path.join(self.data_dir, name)) for name in SOURCES]
+
+    def _build(self):
+        # The JSON is only parsed when the snapshot is missing or stale
+        raw, digest = _read_bytes(self.data_dir)
+        if self.snapshot is not None and self.snapshot.digest == digest:
+            # Touched, not changed
+            return self.snapshot
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                snapshot = load_snapshot(self.snapshot_path)
+                if snapshot.digest == digest:
+                    return snapshot
+            except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+                pass
+        snapshot = compile_snapshot({name: json.loads(data) for name, data in raw.items()}, digest)
+        if self.snapshot_path:
+            save_snapshot(snapshot, self.snapshot_path)
+        return snapshot
+
+    def current(self):
+        if self.data_dir is None or time.monotonic() - self._checked < self.check_interval:
+            return self.snapshot
+        # Whoever gets the lock checks (and maybe compiles); nobody waits for it
+        if not self._lock.acquire(blocking=False):
+            return self.snapshot
+        try:
+            self._checked = time.monotonic()
+            stamp = self._stat_sources()
+            if stamp != self._stamp:
+                self._reload(stamp)
+        finally:
+            self._lock.release()
+        return self.snapshot
+
+    def _reload(self, stamp):
+        started = time.monotonic()
+        try:
+            snapshot = self._build()
+        except Exception as e:
+            # Whatever is wrong with the new sources, the old snapshot keeps serving
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.metrics.inc("kb_reloads_total", outcome="error")
+            return False
+        self._stamp = stamp
+        self.last_error = None
+        changed = snapshot.digest != self.snapshot.digest
+        self.snapshot = snapshot
+        if changed:
+            self.reloads += 1
+            for listener in self.listeners:
+                listener(snapshot)
+        self.metrics.inc("kb_reloads_total", outcome="ok" if changed else "unchanged")
+        self.metrics.observe("kb_reload_seconds", time.monotonic() - started)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the JSON knowledge base into a snapshot file.")
+    parser.add_argument("data_dir", help="directory with " + ", ".join(SOURCES))
+    parser.add_argument("out", help="snapshot file to write")
+    args = parser.parse_args()
+
+    sources, digest = read_sources(args.data_dir)
+    snapshot = compile_snapshot(sources, digest)
+    save_snapshot(snapshot, args.out)
+    print(f"Compiled {len(snapshot.chunks)} chunks, {len(snapshot.service_durations)} services and "
+          f"{len(snapshot.locations)} locations into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"DeadlineExceeded", "InternalServerError", "ResourceExhausted",
+                    "ServiceUnavailable", "TooManyRequests"}
+
+
+class LLMTimeout(TimeoutError):
+    pass
+
+
+def is_retryable(error):
+    # google.api_core errors carry the HTTP status in .code, googleapiclient's in .resp.status
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = getattr(getattr(error, "resp", None), "status", None)
+    return status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second on average, `burst` at once."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        # Waits for a token until deadline (None: not at all); False if none came
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is None or now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class _Flight:
+    # Output of one in-flight prompt, replayed to identical prompts that arrive meanwhile
+
+    def __init__(self):
+        self.texts = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def put(self, text):
+        with self._cond:
+            self.texts.append(text)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i == len(self.texts) and not self.done:
+                    self._cond.wait()
+                texts = self.texts[i:]
+                done, error = self.done, self.error
+            i += len(texts)
+            yield from texts
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class LLMClient:
+    """generate_content() in front of a model, for many conversations at once.
+
+    At most `max_concurrency` requests are upstream at a time, started no
+    faster than `rate` per second (None for no limit). A prompt identical to
+    one already in flight is not sent again: the second caller streams the
+    first one's output. Retryable errors (quota, 5xx, timeouts) are retried
+    with full-jitter exponential backoff, but only while nothing has been
+    streamed yet and the retry can start before `timeout` runs out. With
+    `hedge_after`, a second request goes out if the first has produced no
+    token by then and a slot is free, and whichever streams first is used.
+    Counters and histograms go to `metrics` (the tracer's by default).
+    """
+
+    def __init__(self, model, max_concurrency=16, rate=None, burst=None, timeout=60, max_attempts=4,
+                 backoff=0.5, max_backoff=8, hedge_after=None, metrics=None):
+        self.model = model
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.metrics = metrics or tracing.tracer.metrics
+        self.in_flight = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._limiter = RateLimiter(rate, burst) if rate else None
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        texts = self._call(prompt)
+        if stream:
+            return (Chunk(text) for text in texts)
+        return Chunk("".join(texts))
+
+    def _call(self, prompt):
+        with self._lock:
+            flight = self._flights.get(prompt)
+            leader = flight is None
+            if leader:
+                flight = self._flights[prompt] = _Flight()
+        if not leader:
+            self.metrics.inc("llm_coalesced_total")
+            tracing.annotate(llm_coalesced=True)
+            yield from flight.follow()
+            return
+
+        started = time.monotonic()
+        error = None
+        try:
+            for text in self._attempts(prompt, started + self.timeout):
+                flight.put(text)
+                yield text
+        except GeneratorExit:
+            error = RuntimeError("the first caller stopped reading this reply")
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[prompt]
+            flight.finish(error)
+            outcome = "ok" if error is None else "timeout" if isinstance(error, TimeoutError) else "error"
+            self.metrics.inc("llm_requests_total", outcome=outcome)
+            self.metrics.observe("llm_request_seconds", time.monotonic() - started)
+
+    def _attempts(self, prompt, deadline):
+        for attempt in range(1, self.max_attempts + 1):
+            tracing.annotate(llm_attempts=attempt)
+            streamed = False
+            try:
+                for text in self._race(prompt, deadline, attempt):
+                    streamed = True
+                    yield text
+                return
+            except Exception as e:
+                if streamed or not is_retryable(e) or attempt == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                self.metrics.inc("llm_retries_total", reason=type(e).__name__)
+                time.sleep(delay)
+
+    def _start(self, prompt, events, deadline):
+        # Takes a slot and a rate token, waiting until deadline (None: not at
+        # all), and sends the request. Returns its cancel flag, or None.
+        t0 = time.monotonic()
+        if deadline is None:
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            acquired = self._slots.acquire(timeout=max(0.0, deadline - t0))
+        if not acquired:
+            return None
+        if self._limiter is not None and not self._limiter.acquire(deadline):
+            self._slots.release()
+            return None
+        self.metrics.observe("llm_queue_seconds", time.monotonic() - t0)
+        cancelled = threading.Event()
+        self.executor.submit(self._pump, prompt, events, cancelled)
+        return cancelled
+
+    def _pump(self, prompt, events, cancelled):
+        # Runs one upstream request, forwarding (request, text) to events, then
+        # (request, None) at the end or (request, error)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                if cancelled.is_set():
+                    return
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks carrying only finish metadata have no text
+                    continue
+                events.put((cancelled, text))
+            events.put((cancelled, None))
+        except Exception as e:
+            events.put((cancelled, e))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _race(self, prompt, deadline, attempt):
+        events = queue.Queue()
+        primary = self._start(prompt, events, deadline)
+        if primary is None:
+            raise LLMTimeout(f"no LLM capacity within {self.timeout} s")
+        sent = time.monotonic()
+        self.metrics.inc("llm_attempts_total", kind="retry" if attempt > 1 else "first")
+        running = {primary}
+        winner = None
+        hedge_at = time.monotonic() + self.hedge_after if self.hedge_after else None
+        try:
+            while True:
+                now = time.monotonic()
+                wait = deadline - now
+                if hedge_at is not None:
+                    wait = min(wait, hedge_at - now)
+                try:
+                    request, item = events.get(timeout=max(0.0, wait))
+                except queue.Empty:
+                    if time.monotonic() >= deadline:
+                        raise LLMTimeout(f"no complete LLM reply within {self.timeout} s")
+                    # Only hedge into spare capacity
+                    hedge = self._start(prompt, events, None)
+                    hedge_at = None
+                    if hedge is not None:
+                        running.add(hedge)
+                        self.metrics.inc("llm_attempts_total", kind="hedge")
+                        tracing.annotate(llm_hedged=True)
+                    continue
+                if request not in running:
+                    continue
+                if isinstance(item, Exception):
+                    running.discard(request)
+                    if running:
+                        continue
+                    raise item
+                if winner is None:
+                    winner = request
+                    hedge_at = None
+                    for other in running - {winner}:
+                        other.set()
+                    running = {winner}
+                    self.metrics.observe("llm_first_token_seconds", time.monotonic() - sent)
+                    if winner is not primary:
+                        self.metrics.inc("llm_hedge_wins_total")
+                if item is None:
+                    return
+                yield item
+        finally:
+            for request in running:
+                request.set()
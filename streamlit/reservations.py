@@ -0,0 +1,47 @@
+import itertools
+import threading
+import time
+
+
+class SlotTaken(Exception):
+    pass
+
+
+class Reservations:
+    """Short-lived in-process holds on (calendar id, start, end).
+
+    A booking takes a hold while it re-verifies the slot, keeps it for the
+    duration of the Calendar insert, and releases it once the event is in
+    the cached busy set. Holds expire after `ttl` seconds so a crashed or
+    hung insert cannot block a slot for long.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.conflicts = 0
+        self._holds = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def hold(self, calendar_id, start, end):
+        # Returns a hold id, or None if an active hold overlaps
+        now = time.monotonic()
+        with self._lock:
+            for hold_id, (cal, s, e, expires) in list(self._holds.items()):
+                if expires <= now:
+                    del self._holds[hold_id]
+                elif cal == calendar_id and s < end and e > start:
+                    self.conflicts += 1
+                    return None
+            hold_id = next(self._ids)
+            self._holds[hold_id] = (calendar_id, start, end, now + self.ttl)
+            return hold_id
+
+    def release(self, hold_id):
+        with self._lock:
+            self._holds.pop(hold_id, None)
+
+    def active(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for *_, expires in self._holds.values() if expires > now)
@@ -0,0 +1,76 @@
+import heapq
+import math
+import re
+from collections import defaultdict
+
+STOP_WORDS = {"what", "is", "the", "a", "an", "of", "to", "for", "and", "or", "in", "on", "at", "do", "you", "have", "how", "much", "does", "can", "i", "my", "me", "this", "that", "it", "are", "was", "be", "your", "yes", "no"}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def stem(word):
+    # Fold simple plurals so "crowns" finds "crown"
+    if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(w) for w in TOKEN_RE.findall(text.lower()) if w not in STOP_WORDS and len(w) > 2]
+
+
+class InvertedIndex:
+    """BM25 index over a fixed list of text chunks.
+
+    Each posting stores the term's precomputed BM25 weight for that chunk, so
+    a query is a sum over the postings of its distinct terms plus a top-k heap.
+    Only the `max_postings` highest-weighted postings of each term are kept,
+    which bounds the cost of common words (whose low idf makes the tail
+    irrelevant) as the knowledge base grows.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75, max_postings=256):
+        self.chunks = list(chunks)
+        term_counts = []
+        document_frequency = defaultdict(int)
+        for chunk in self.chunks:
+            counts = defaultdict(int)
+            for token in tokenize(chunk):
+                counts[token] += 1
+            term_counts.append(counts)
+            for token in counts:
+                document_frequency[token] += 1
+
+        n_chunks = len(self.chunks)
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = sum(lengths) / n_chunks if n_chunks else 0.0
+        self.postings = defaultdict(list)
+        for chunk_id, counts in enumerate(term_counts):
+            norm = k1 * (1 - b + b * lengths[chunk_id] / avg_length) if avg_length else k1
+            for token, tf in counts.items():
+                df = document_frequency[token]
+                idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+                self.postings[token].append((chunk_id, idf * tf * (k1 + 1) / (tf + norm)))
+        self.postings = {token: sorted(postings, key=lambda p: -p[1])[:max_postings]
+                         for token, postings in self.postings.items()}
+
+    def search(self, text, k=10):
+        return self.search_terms(tokenize(text), k)
+
+    def search_terms(self, terms, k=10):
+        # Already tokenized, e.g. the keywords EntityExtractor returns
+        scores = defaultdict(float)
+        for token in set(terms):
+            for chunk_id, weight in self.postings.get(token, ()):
+                scores[chunk_id] += weight
+        # Ties keep knowledge-base order
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    # Merge ranked lists of hashable items; items ranked high anywhere win
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
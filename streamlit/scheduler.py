@@ -0,0 +1,375 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dateutil import parser as date_parser
+
+from availability import SLOT_STEP_MINUTES, WORK_DAYS, BusyTimeline, parse_busy_periods
+from reservations import Reservations, SlotTaken
+
+LOCATIONS = {
+    "Christiana": {"open": (7, 30), "close": (18, 30), "days": WORK_DAYS},
+    "Newport": {"open": (8, 0), "close": (17, 0), "days": WORK_DAYS},
+}
+DEFAULT_HOURS = {"open": (8, 0), "close": (17, 0), "days": WORK_DAYS}
+
+# Google's freebusy.query accepts at most 50 calendars per request
+FREEBUSY_MAX_CALENDARS = 50
+
+
+def _parse_timestamp(value):
+    # freebusy returns plain RFC 3339; fromisoformat is ~50x faster than dateutil
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return date_parser.parse(value)
+
+
+class FreeBusyCache:
+    """Busy periods for many calendars, fetched with batched freebusy queries.
+
+    One freebusy.query covers up to 50 calendars, so a practice with a
+    calendar per provider per location costs one request per refresh instead
+    of one events().list per calendar. Calendars the API reports errors for
+    are left out (they are never offered). Bookings are written through.
+    Listeners get the same (calendar id, changed periods or None) calls as
+    EventCache's.
+    """
+
+    def __init__(self, calendar_service, calendar_ids, tz, max_staleness=60, days_ahead=22):
+        self.calendar_service = calendar_service
+        self.calendar_ids = list(dict.fromkeys(calendar_ids))
+        self.tz = tz
+        self.max_staleness = max_staleness
+        self.days_ahead = days_ahead
+        self.busy_periods = {}
+        self.errors = {}
+        self.synced_at = None
+        self.queries = 0
+        self._timelines = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def _query(self, calendar_ids, time_min, time_max):
+        return self.calendar_service.freebusy().query(body={
+            'timeMin': time_min.isoformat(),
+            'timeMax': time_max.isoformat(),
+            'timeZone': str(self.tz),
+            'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+        }).execute()
+
+    def _sync(self):
+        time_min = self.tz.localize(datetime.combine(datetime.now(self.tz).date(), datetime.min.time()))
+        time_max = time_min + timedelta(days=self.days_ahead)
+        batches = [self.calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]
+                   for i in range(0, len(self.calendar_ids), FREEBUSY_MAX_CALENDARS)]
+        if len(batches) == 1:
+            results = [self._query(batches[0], time_min, time_max)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+                results = list(pool.map(lambda batch: self._query(batch, time_min, time_max), batches))
+
+        busy_periods = {}
+        errors = {}
+        for result in results:
+            for calendar_id, info in result.get('calendars', {}).items():
+                if info.get('errors'):
+                    errors[calendar_id] = info['errors']
+                    continue
+                busy_periods[calendar_id] = [
+                    (_parse_timestamp(b['start']), _parse_timestamp(b['end'])) for b in info.get('busy', [])]
+        # freebusy has no change feed; diff each calendar's merged blocks
+        changes = {}
+        for calendar_id in set(self.busy_periods) | set(busy_periods):
+            old, new = self.busy_periods.get(calendar_id), busy_periods.get(calendar_id)
+            if old is None or new is None:
+                changes[calendar_id] = None
+            elif old != new:
+                changes[calendar_id] = list(set(old) ^ set(new))
+
+        self.busy_periods = busy_periods
+        self.errors = errors
+        self.queries += len(batches)
+        self.synced_at = time.monotonic()
+        for calendar_id, changed in changes.items():
+            self._timelines.pop(calendar_id, None)
+            self._notify(calendar_id, changed)
+
+    def _notify(self, calendar_id, changed):
+        for listener in self.listeners:
+            listener(calendar_id, changed)
+
+    def refresh(self, max_staleness=None):
+        if max_staleness is None:
+            max_staleness = self.max_staleness
+        with self._lock:
+            if self.synced_at is None or time.monotonic() - self.synced_at >= max_staleness:
+                self._sync()
+
+    def timelines(self, max_staleness=None):
+        self.refresh(max_staleness)
+        with self._lock:
+            for calendar_id, periods in self.busy_periods.items():
+                if calendar_id not in self._timelines:
+                    self._timelines[calendar_id] = BusyTimeline(periods)
+            return dict(self._timelines)
+
+    def insert(self, body, calendar_id=None):
+        calendar_id = calendar_id or self.calendar_ids[0]
+        # Not under the lock: reads shouldn't wait on the network, and
+        # Scheduler.book holds the slot until the event is added below
+        event = self.calendar_service.events().insert(
+            calendarId=calendar_id, body=body).execute()
+        with self._lock:
+            added = parse_busy_periods([event], self.tz)
+            self.busy_periods = dict(self.busy_periods)
+            self.busy_periods[calendar_id] = self.busy_periods.get(calendar_id, []) + added
+            self._timelines.pop(calendar_id, None)
+            self._notify(calendar_id, added)
+        return event
+
+
+class AvailabilityViews:
+    """Materialized availability per location, duration and day.
+
+    Two levels: for each (calendar, day), a start bitmask per duration in
+    `durations` (computed together from one occupancy bitmap); and for each
+    (location, duration, day), that day's openings merged across the
+    location's calendars. The source's listeners report which busy periods
+    changed, and only the days they touch are dropped and rebuilt on the next
+    read; a whole-calendar reload drops that calendar. Days before today are
+    pruned when the date changes, and new days at the end of the window are
+    built when first read.
+    """
+
+    def __init__(self, scheduler, durations=()):
+        self.scheduler = scheduler
+        self.durations = sorted(set(durations))
+        self.rebuilt_days = 0
+        self._starts = {}
+        self._days = {}
+        self._today = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        scheduler.source.listeners.append(self.invalidate)
+
+    def invalidate(self, calendar_id, changed=None):
+        tz = self.scheduler.tz
+        with self._lock:
+            self._generation += 1
+            if changed is None:
+                self._starts = {key: starts for key, starts in self._starts.items() if key[0] != calendar_id}
+                self._days = {}
+                return
+            for start, end in changed:
+                day = start.astimezone(tz).date()
+                while day <= end.astimezone(tz).date():
+                    if self._starts.pop((calendar_id, day), None) is not None:
+                        for key in [key for key in self._days if key[2] == day]:
+                            del self._days[key]
+                    day += timedelta(days=1)
+
+    def reset(self, durations=None):
+        # Location hours changed: every view is rebuilt on its next read
+        with self._lock:
+            self._generation += 1
+            self._starts = {}
+            self._days = {}
+            if durations is not None:
+                self.durations = sorted(set(durations))
+
+    def _read(self, collect, now, max_staleness):
+        # An invalidation between reading the timelines and taking the lock
+        # means they may predate it; read again (from cache) until they don't
+        while True:
+            generation = self._generation
+            timelines = self.scheduler.source.timelines(max_staleness)
+            with self._lock:
+                if generation == self._generation:
+                    if self._today != now.date():
+                        self._starts = {key: v for key, v in self._starts.items() if key[1] >= now.date()}
+                        self._days = {key: v for key, v in self._days.items() if key[2] >= now.date()}
+                        self._today = now.date()
+                    return collect(timelines)
+            max_staleness = None
+
+    def _calendar_starts(self, name, calendar_id, check_date, open_dt, close_dt, duration_minutes, timeline):
+        entry = self._starts.get((calendar_id, check_date))
+        if entry is None:
+            entry = self._starts[(calendar_id, check_date)] = {}
+            self.rebuilt_days += 1
+        starts = entry.get(name)
+        if starts is None or duration_minutes not in starts:
+            durations = self.durations if duration_minutes in self.durations else [duration_minutes]
+            starts = entry[name] = dict(starts or {})
+            starts.update(timeline.free_starts_many(open_dt, close_dt, durations, self.scheduler.step_minutes))
+        return starts[duration_minutes]
+
+    def _day(self, name, duration_minutes, check_date, timelines):
+        # [(start, [(location, calendar id), ...]), ...] in start order, all day
+        key = (name, duration_minutes, check_date)
+        day = self._days.get(key)
+        if day is not None:
+            return day
+        openings = {}
+        hours = self.scheduler.hours_on(name, check_date)
+        if hours is not None:
+            open_dt, close_dt = hours
+            for calendar_id in self.scheduler.calendars_for(name):
+                timeline = timelines.get(calendar_id)
+                if timeline is None:
+                    continue
+                starts, unit = self._calendar_starts(name, calendar_id, check_date, open_dt, close_dt,
+                                                     duration_minutes, timeline)
+                k = 0
+                while starts:
+                    if starts & 1:
+                        openings.setdefault(open_dt + k * unit, []).append((name, calendar_id))
+                    starts >>= 1
+                    k += 1
+        day = self._days[key] = sorted(openings.items())
+        return day
+
+    def _collect(self, days, duration_minutes, location, now, timelines):
+        names = [location] if location else list(self.scheduler.locations)
+        openings = {}
+        for check_date in days:
+            for name in names:
+                for slot_time, providers in self._day(name, duration_minutes, check_date, timelines):
+                    if slot_time > now:
+                        if slot_time in openings:
+                            openings[slot_time] = openings[slot_time] + providers
+                        else:
+                            openings[slot_time] = providers
+        return openings if len(names) == 1 else dict(sorted(openings.items()))
+
+    def openings(self, duration_minutes, location=None, days_ahead=21, now=None, max_staleness=None):
+        now = now or datetime.now(self.scheduler.tz)
+        days = [now.date() + timedelta(days=d) for d in range(days_ahead)]
+        return self._read(lambda timelines: self._collect(days, duration_minutes, location, now, timelines),
+                          now, max_staleness)
+
+    def day_openings(self, check_date, duration_minutes, location=None, now=None, max_staleness=None):
+        now = now or datetime.now(self.scheduler.tz)
+        return self._read(lambda timelines: self._collect([check_date], duration_minutes, location, now, timelines),
+                          now, max_staleness)
+
+
+class Scheduler:
+    """Joint availability over a table of locations and their calendars.
+
+    `source` is an EventCache or FreeBusyCache. `location_calendars` maps a
+    location to its provider calendars; a location without an entry (the
+    single-calendar demo) uses every calendar the source has. A slot is open
+    when any provider at the location is free for the whole duration.
+
+    available() and day_openings() read the materialized views; openings()
+    and free_slots() compute from the timelines they are given.
+    """
+
+    def __init__(self, source, tz, locations=LOCATIONS, location_calendars=None,
+                 step_minutes=SLOT_STEP_MINUTES, reservations=None, durations=()):
+        self.source = source
+        self.tz = tz
+        self.locations = locations
+        self.location_calendars = location_calendars or {}
+        self.step_minutes = step_minutes
+        self.reservations = reservations or Reservations()
+        self.views = AvailabilityViews(self, durations)
+        self._book_lock = threading.Lock()
+
+    def set_locations(self, locations, durations=None):
+        # New hours (a knowledge-base reload); bookings and holds carry on
+        self.locations = locations
+        self.views.reset(durations)
+
+    def calendars_for(self, location):
+        return self.location_calendars.get(location) or self.source.calendar_ids
+
+    def hours_on(self, location, check_date):
+        # (open, close) datetimes, or None when the location is closed that day
+        hours = self.locations.get(location, DEFAULT_HOURS)
+        if check_date.weekday() not in hours['days']:
+            return None
+        open_dt = self.tz.localize(datetime.combine(
+            check_date, datetime.min.time().replace(hour=hours['open'][0], minute=hours['open'][1])))
+        close_dt = self.tz.localize(datetime.combine(
+            check_date, datetime.min.time().replace(hour=hours['close'][0], minute=hours['close'][1])))
+        return open_dt, close_dt
+
+    def _day_openings(self, check_date, names, timelines, duration_minutes, now, openings):
+        for name in names:
+            hours = self.hours_on(name, check_date)
+            if hours is None:
+                continue
+            open_dt, close_dt = hours
+            for calendar_id in self.calendars_for(name):
+                timeline = timelines.get(calendar_id)
+                if timeline is None:
+                    continue
+                starts, unit = timeline.free_starts(open_dt, close_dt, duration_minutes, self.step_minutes)
+                k = 0
+                while starts:
+                    if starts & 1:
+                        slot_time = open_dt + k * unit
+                        if slot_time > now:
+                            openings.setdefault(slot_time, []).append((name, calendar_id))
+                    starts >>= 1
+                    k += 1
+
+    def openings(self, timelines, duration_minutes, location=None, days_ahead=21, now=None):
+        """Map each open start time to the (location, calendar id) pairs free
+        at that time, over `location` or, when None, every location."""
+        now = now or datetime.now(self.tz)
+        names = [location] if location else list(self.locations)
+        openings = {}
+        for day_offset in range(days_ahead):
+            self._day_openings(now.date() + timedelta(days=day_offset), names, timelines,
+                               duration_minutes, now, openings)
+        return dict(sorted(openings.items()))
+
+    def free_slots(self, timelines, duration_minutes, location=None, days_ahead=21, now=None):
+        return list(self.openings(timelines, duration_minutes, location, days_ahead, now))
+
+    def available(self, duration_minutes, location=None, days_ahead=21, max_staleness=None):
+        return list(self.views.openings(duration_minutes, location, days_ahead, max_staleness=max_staleness))
+
+    def available_by_location(self, duration_minutes, location=None, days_ahead=21, max_staleness=None):
+        # The offices keep different hours, so each keeps its own start times
+        names = [location] if location else list(self.locations)
+        by_location = {name: [] for name in names}
+        for slot_time, providers in self.views.openings(duration_minutes, location, days_ahead,
+                                                        max_staleness=max_staleness).items():
+            for name in dict.fromkeys(name for name, _ in providers):
+                by_location[name].append(slot_time)
+        return by_location
+
+    def day_openings(self, check_date, duration_minutes, location=None, max_staleness=None):
+        # Keyed by start time, so an exact requested time is a single lookup
+        return self.views.day_openings(check_date, duration_minutes, location, max_staleness=max_staleness)
+
+    def book(self, slot_time, location, duration_minutes, body):
+        """Insert into the first provider calendar still free for the slot.
+
+        The check against the cached busy set and the hold happen under one
+        lock; the insert runs outside it under the hold, which is released
+        once the write-through cache has the event. Raises SlotTaken when no
+        provider at the location is free.
+        """
+        end = slot_time + timedelta(minutes=duration_minutes)
+        with self._book_lock:
+            timelines = self.source.timelines()
+            for calendar_id in self.calendars_for(location):
+                timeline = timelines.get(calendar_id)
+                if timeline is None or not timeline.is_free(slot_time, end):
+                    continue
+                hold_id = self.reservations.hold(calendar_id, slot_time, end)
+                if hold_id is not None:
+                    break
+            else:
+                raise SlotTaken(f"{slot_time:%b %d %I:%M %p} at {location} is no longer available")
+        try:
+            return self.source.insert(body, calendar_id)
+        finally:
+            self.reservations.release(hold_id)
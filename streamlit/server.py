@@ -0,0 +1,198 @@
+"""Headless webhook server for texting: one message in, one reply out.
+
+POST /message {"conversation_id": "...", "text": "..."} -> {"reply": "..."}
+GET /healthz, GET /metrics (the tracing module's Prometheus text)
+
+Runs the same agent()/parse_and_book as the Streamlit app. Blocking Calendar
+and LLM work goes to a bounded thread pool; messages in one conversation
+are answered strictly in arrival order. Once max_pending messages are
+queued or running, a message for an idle conversation gets 503 with
+Retry-After; follow-ups to a conversation already in flight still queue
+behind it (up to MAX_QUEUED_PER_CONVERSATION), so a burst of texts is not
+split up by a retry. Conversations live in a SessionStore: capped history,
+dropped after 30 idle minutes. Edits to the JSON knowledge base (KNOWLEDGE_DIR)
+are picked up without a restart.
+
+Usage: python server.py --port 8080   (CALENDAR_ID and SERVICE_ACCOUNT_FILE in the environment;
+       LOCATION_CALENDARS, a JSON object of calendar ids per location, instead of CALENDAR_ID)
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import assistant
+import tracing
+from llm_client import LLMClient
+from sessions import SessionStore
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_QUEUED_PER_CONVERSATION = 8
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class Busy(Exception):
+    pass
+
+
+class ConversationServer:
+    def __init__(self, workers=32, max_pending=128):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.sessions = SessionStore(assistant.new_session)
+        # conversation id -> [lock, number of messages waiting on or holding it]
+        self._locks = {}
+
+    async def handle_message(self, conversation_id, text):
+        entry = self._locks.get(conversation_id)
+        if (entry is None and self.pending >= self.max_pending
+                or entry is not None and entry[1] >= MAX_QUEUED_PER_CONVERSATION):
+            self.rejected += 1
+            raise Busy()
+        self.pending += 1
+        entry = self._locks.setdefault(conversation_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters first in, first out
+            async with entry[0]:
+                session = self.sessions.get(conversation_id)
+                session.add("Patient", text)
+                try:
+                    reply = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, assistant.agent, text, session)
+                except Exception:
+                    session.pop()
+                    raise
+                session.add("Assistant", reply)
+                return reply
+        finally:
+            self.pending -= 1
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[conversation_id]
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/healthz":
+            return 200, "application/json", {"pending": self.pending, "conversations": len(self.sessions)}
+        if method == "GET" and path == "/metrics":
+            return 200, "text/plain; version=0.0.4", tracing.tracer.metrics.render()
+        if method != "POST" or path != "/message":
+            return 404, "application/json", {"error": "not found"}
+        try:
+            payload = json.loads(body)
+            conversation_id = str(payload["conversation_id"])
+            text = str(payload["text"]).strip()
+        except (ValueError, KeyError, TypeError):
+            return 400, "application/json", {"error": "expected JSON with conversation_id and text"}
+        if not text:
+            return 400, "application/json", {"error": "empty text"}
+        try:
+            reply = await self.handle_message(conversation_id, text)
+        except Busy:
+            return 503, "application/json", {"error": "busy, retry shortly"}
+        except Exception as e:
+            # The details go to the log, not to whoever called the webhook
+            tracing.log_error("message failed", e, conversation_id=conversation_id)
+            return 500, "application/json", {"error": "internal error, please try again"}
+        return 200, "application/json", {"reply": reply}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, content_type, payload = 413, "application/json", {"error": "body too large"}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, content_type, payload = await self.route(method, path.split("?")[0], body)
+
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                data = data.encode()
+                extra = "Retry-After: 1\r\n" if status == 503 else ""
+                writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                              f"Content-Length: {len(data)}\r\n{extra}\r\n").encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="0.0.0.0", port=8080):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def build_clients():
+    # Same clients as app.py, configured from the environment instead of st.secrets
+    import vertexai
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    from vertexai.generative_models import GenerativeModel
+
+    from calendar_cache import EventCache
+    from scheduler import FreeBusyCache
+
+    with open(os.environ["SERVICE_ACCOUNT_FILE"]) as f:
+        info = json.load(f)
+    credentials = service_account.Credentials.from_service_account_info(
+        info, scopes=['https://www.googleapis.com/auth/calendar'])
+    vertexai.init(project=info["project_id"], location="us-central1")
+    calendar_service = build('calendar', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False)
+    max_staleness = int(os.environ.get("CALENDAR_CACHE_SECONDS", 60))
+    # Production: LOCATION_CALENDARS='{"Christiana": ["id", ...], "Newport": [...]}', as in app.py's secrets
+    location_calendars = {loc: list(ids) for loc, ids in json.loads(os.environ.get("LOCATION_CALENDARS", "{}")).items()}
+    if location_calendars:
+        calendar_ids = [c for ids in location_calendars.values() for c in ids]
+        busy_source = FreeBusyCache(calendar_service, calendar_ids, assistant.est, max_staleness=max_staleness)
+    else:
+        busy_source = EventCache(calendar_service, os.environ["CALENDAR_ID"], assistant.est,
+                                 max_staleness=max_staleness)
+    return busy_source, location_calendars, GenerativeModel("gemini-2.0-flash-001")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8080)))
+    parser.add_argument("--workers", type=int, default=32, help="threads for blocking Calendar/LLM calls")
+    parser.add_argument("--max-pending", type=int, default=128, help="queued + running messages before 503")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="LLM requests in flight at once")
+    parser.add_argument("--llm-rate", type=float, help="LLM requests started per second (default: no limit)")
+    parser.add_argument("--llm-hedge-after", type=float, help="seconds without a first token before hedging")
+    args = parser.parse_args()
+
+    busy_source, location_calendars, gemini = build_clients()
+    llm = LLMClient(gemini, max_concurrency=args.llm_concurrency, rate=args.llm_rate,
+                    hedge_after=args.llm_hedge_after)
+    assistant.configure(busy_source, llm, vector_index_dir=os.environ.get("VECTOR_INDEX_DIR", "embeddings"),
+                        location_calendars=location_calendars,
+                        knowledge_dir=os.environ.get("KNOWLEDGE_DIR", "data"),
+                        knowledge_snapshot=os.environ.get("KNOWLEDGE_SNAPSHOT", "knowledge.snapshot"))
+
+    async def run():
+        server = await ConversationServer(args.workers, args.max_pending).serve(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
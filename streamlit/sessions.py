@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from entities import resolve_dates
+
+
+class Session:
+    """One conversation: a capped message history plus facts derived from
+    each message as it is added, so a turn never rescans the transcript.
+
+    Each message goes through an EntityExtractor once: the one
+    `get_extractor()` returns at that moment, so a knowledge-base reload
+    applies to conversations already under way.
+    Service and location follow the original whole-transcript rules (first
+    service in table order mentioned anywhere; Christiana before Newport).
+    The requested day, part of day and provider come from the latest patient
+    message that mentions one. Facts survive when old messages are trimmed;
+    the keywords of the last few messages are kept for retrieval.
+    """
+
+    def __init__(self, get_extractor, max_messages=40, max_chars=16000, max_message_chars=2000, recent_messages=6):
+        self.get_extractor = get_extractor
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.max_message_chars = max_message_chars
+        self.messages = deque()
+        self.chars = 0
+        self.dropped = 0
+        self.service = None
+        self.location = None
+        self.patient_name = None
+        self.provider = None
+        self.scheduling = False
+        self.dates = None
+        self.date_text = None
+        self.hours = None
+        self.keywords = deque(maxlen=recent_messages)
+        self.last_active = time.monotonic()
+        self._services_seen = set()
+        self._locations_seen = set()
+
+    def add(self, role, content):
+        content = content[:self.max_message_chars]
+        extractor = self.get_extractor()
+        found = extractor.extract(content)
+        # "deep cleaning" is not also a mention of a cleaning
+        named = {s for s in found.services if not any(s != t and s.lower() in t.lower() for t in found.services)}
+        new_services = named - self._services_seen
+        if new_services:
+            self._services_seen |= new_services
+            self.service = next((s for s in extractor.services if s in self._services_seen), self.service)
+        new_locations = set(found.locations) - self._locations_seen
+        if new_locations:
+            self._locations_seen |= new_locations
+            self.location = next((l for l in extractor.locations if l in self._locations_seen), self.location)
+        self.scheduling = self.scheduling or found.scheduling
+        if role == "Patient":
+            if found.dates:
+                self.dates = found.dates
+                self.date_text = " ".join(d.text.lower() for d in found.dates)
+            self.hours = found.hours or self.hours
+            self.provider = found.providers[-1] if found.providers else self.provider
+            self.patient_name = found.patient_name or self.patient_name
+        self.keywords.append(found.keywords)
+
+        self.messages.append((role, content))
+        self.chars += len(content)
+        while len(self.messages) > self.max_messages or self.chars > self.max_chars:
+            _, old = self.messages.popleft()
+            self.chars -= len(old)
+            self.dropped += 1
+        self.last_active = time.monotonic()
+
+    def pop(self):
+        # Undo the last add (e.g. the turn failed); derived facts are kept
+        _, content = self.messages.pop()
+        self.chars -= len(content)
+        self.keywords.pop()
+
+    def requested_window(self, now, days_ahead=21):
+        dates = resolve_dates(self.dates or (), now.date(), days_ahead) or None
+        return dates, self.hours
+
+    def recent_keywords(self):
+        return [keyword for keywords in self.keywords for keyword in keywords]
+
+    def window(self, max_chars, skip_last=True):
+        """Newest messages that fit in max_chars, oldest first, as
+        "Role: content" lines, plus how many earlier messages were left out."""
+        messages = list(self.messages)
+        if skip_last and messages:
+            messages.pop()
+        lines = []
+        used = 0
+        for role, content in reversed(messages):
+            line = f"{role}: {content}\n"
+            if used + len(line) > max_chars and lines:
+                break
+            lines.append(line)
+            used += len(line)
+        return lines[::-1], self.dropped + len(messages) - len(lines)
+
+    def facts(self):
+        facts = []
+        if self.patient_name:
+            facts.append(f"patient name: {self.patient_name}")
+        if self.service:
+            facts.append(f"service: {self.service}")
+        if self.location:
+            facts.append(f"location: {self.location}")
+        if self.provider:
+            facts.append(f"provider: {self.provider}")
+        if self.date_text:
+            facts.append(f"asked about: {self.date_text}")
+        return "; ".join(facts)
+
+
+class SessionStore:
+    """Sessions by conversation id, evicted after `idle_seconds` without a
+    message or, beyond `max_sessions`, least recently active first."""
+
+    def __init__(self, factory, max_sessions=10000, idle_seconds=1800):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            # Least recently active first, so only idle sessions are visited
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_active < self.idle_seconds:
+                    break
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            session = self._sessions.pop(key, None) or self.factory()
+            session.last_active = now
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            return session
+
+    def __len__(self):
+        return len(self._sessions)
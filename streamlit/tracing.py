@@ -0,0 +1,193 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROMPT_BUCKETS = (500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+logger = logging.getLogger("assistant.trace")
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans and attributes recorded during one agent turn.
+
+    Spans may be added from executor threads (the calendar fetch runs beside
+    retrieval), so they are appended under a lock. Offsets are relative to
+    the start of the turn.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.seconds = None
+        self.spans = []
+        self.attrs = {}
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, seconds, attrs):
+        with self._lock:
+            self.spans.append({"name": name, "start_ms": round(start * 1000, 2),
+                               "ms": round(seconds * 1000, 2), **attrs})
+
+    def stage_seconds(self):
+        totals = {}
+        with self._lock:
+            for s in self.spans:
+                totals[s["name"]] = totals.get(s["name"], 0.0) + s["ms"] / 1000
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            return {"severity": "INFO", "message": "agent turn", "trace_id": self.id,
+                    "started": self.started, "ms": round(self.seconds * 1000, 2),
+                    **self.attrs, "spans": list(self.spans)}
+
+
+@contextmanager
+def span(name, **attrs):
+    # Yields the attribute dict so the caller can add counts it only knows at
+    # the end (e.g. number of slots). A no-op outside a traced turn.
+    trace = _current.get()
+    if trace is None:
+        yield attrs
+        return
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        trace.add_span(name, t0 - trace._t0, time.perf_counter() - t0, attrs)
+
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        with trace._lock:
+            trace.attrs.update(attrs)
+
+
+def log_error(message, error, **fields):
+    # One JSON line like a turn's, tied to the current turn's trace when there is one
+    trace = _current.get()
+    logger.error(json.dumps({"severity": "ERROR", "message": message, "trace_id": trace.id if trace else None,
+                             "error": f"{type(error).__name__}: {error}", **fields}, default=str))
+
+
+def bind(fn):
+    # For executor.submit: run fn with the caller's trace as current
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _label_text(labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+
+class Metrics:
+    """Prometheus-style counters and cumulative histograms, rendered in the
+    text exposition format by render()."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=STAGE_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            hist = self.histograms[key]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[1][i] += 1
+            hist[2] += value
+            hist[3] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_label_text(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), (buckets, counts, total, count) in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, c in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {c}")
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Wraps agent turns: keeps the last `keep` traces for the UI, feeds the
+    metrics, and logs each finished turn as one JSON line."""
+
+    def __init__(self, keep=50):
+        self.recent = deque(maxlen=keep)
+        self.metrics = Metrics()
+
+    @contextmanager
+    def turn(self):
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            yield trace
+        except Exception as e:
+            trace.attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            trace.seconds = time.perf_counter() - trace._t0
+            self.finish(trace)
+
+    def finish(self, trace):
+        self.recent.append(trace)
+        kind = "scheduling" if trace.attrs.get("scheduling") else "faq"
+        self.metrics.inc("agent_turns_total", kind=kind)
+        self.metrics.observe("agent_turn_seconds", trace.seconds, kind=kind)
+        for stage, seconds in trace.stage_seconds().items():
+            self.metrics.observe("agent_stage_seconds", seconds, stage=stage)
+        if "prompt_chars" in trace.attrs:
+            self.metrics.observe("agent_prompt_chars", trace.attrs["prompt_chars"], PROMPT_BUCKETS)
+        if trace.attrs.get("cache_hit"):
+            self.metrics.inc("agent_answer_cache_hits_total")
+        if trace.attrs.get("booked"):
+            self.metrics.inc("agent_bookings_total")
+        if "error" in trace.attrs:
+            self.metrics.inc("agent_turn_errors_total")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(trace.to_dict(), default=str))
+
+    def breakdown(self, n=10):
+        # Newest first, one row per turn with milliseconds per stage
+        rows = []
+        for trace in list(self.recent)[-n:][::-1]:
+            row = {"turn": time.strftime("%H:%M:%S", time.localtime(trace.started)),
+                   "total ms": round(trace.seconds * 1000)}
+            for stage, seconds in trace.stage_seconds().items():
+                row[f"{stage} ms"] = round(seconds * 1000)
+            row["prompt tokens"] = trace.attrs.get("prompt_tokens")
+            row["slots"] = trace.attrs.get("slots")
+            rows.append(row)
+        return rows
+
+
+tracer = Tracer()
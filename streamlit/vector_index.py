@@ -0,0 +1,145 @@
+"""Memory-mapped dense embedding index for semantic retrieval.
+
+An index directory holds two files: embeddings.npy, an (n_chunks, dim)
+float16/float32 matrix of L2-normalised embeddings that is opened with mmap,
+and chunks.json, which holds the chunk ids, texts and the encoder needed to
+embed queries the same way.
+
+Build offline from a JSON list of strings or {"id", "text"} objects:
+
+    python vector_index.py chunks.json embeddings --encoder sentence-transformers
+"""
+import argparse
+import json
+import os
+import zlib
+
+import numpy as np
+
+from retrieval import tokenize
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.json"
+
+
+class HashingEncoder:
+    """Signed feature hashing over unigrams and bigrams. No model download,
+    deterministic across processes; good enough for tests and small offices."""
+
+    name = "hashing"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def config(self):
+        return {"dim": self.dim}
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]:
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class SentenceTransformerEncoder:
+    """The all-MiniLM-L6-v2 model used in the RAG notebooks. The library is
+    imported on first encode so opening an index stays cheap."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        self.model_name = model_name
+        self._model = None
+
+    def config(self):
+        return {"model_name": self.model_name}
+
+    def encode(self, texts):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        vectors = self._model.encode(list(texts), convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+ENCODERS = {cls.name: cls for cls in (HashingEncoder, SentenceTransformerEncoder)}
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def build_index(chunks, encoder, path, dtype="float32", batch_size=256):
+    ids = [c["id"] if isinstance(c, dict) else f"chunk_{i}" for i, c in enumerate(chunks)]
+    texts = [c["text"] if isinstance(c, dict) else c for c in chunks]
+    os.makedirs(path, exist_ok=True)
+
+    matrix = None
+    for start in range(0, len(texts), batch_size):
+        block = encoder.encode(texts[start:start + batch_size])
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(
+                os.path.join(path, EMBEDDINGS_FILE), mode="w+", dtype=dtype,
+                shape=(len(texts), block.shape[1]))
+        matrix[start:start + len(block)] = block
+    if matrix is not None:
+        matrix.flush()
+
+    with open(os.path.join(path, CHUNKS_FILE), "w") as f:
+        json.dump({"encoder": encoder.name, "encoder_config": encoder.config(),
+                   "ids": ids, "texts": texts}, f)
+
+
+class VectorIndex:
+    def __init__(self, path, encoder=None):
+        with open(os.path.join(path, CHUNKS_FILE)) as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.texts = meta["texts"]
+        self.matrix = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        self.encoder = encoder or ENCODERS[meta["encoder"]](**meta["encoder_config"])
+
+    def search(self, queries, k=10, block_size=4096):
+        # Cosine top-k for a batch of queries; returns one [(row, score)] list
+        # per query. The matrix is scored in blocks so float16 rows are
+        # upcast a block at a time rather than all at once.
+        q = self.encoder.encode(queries).astype(np.float32)
+        n = self.matrix.shape[0]
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, block_size):
+            block = np.asarray(self.matrix[start:start + block_size], dtype=np.float32)
+            scores[:, start:start + len(block)] = q @ block.T
+
+        k = min(k, n)
+        if k == 0:
+            return [[] for _ in queries]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            order = candidates[np.argsort(-scores[row, candidates], kind="stable")]
+            results.append([(int(i), float(scores[row, i])) for i in order])
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a memory-mapped embedding index.")
+    parser.add_argument("chunks", help="JSON list of strings or {id, text} objects")
+    parser.add_argument("out", help="output directory")
+    parser.add_argument("--encoder", choices=sorted(ENCODERS), default="sentence-transformers")
+    # float16 halves the file but every query pays to upcast it
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32")
+    args = parser.parse_args()
+
+    with open(args.chunks) as f:
+        chunks = json.load(f)
+    build_index(chunks, ENCODERS[args.encoder](), args.out, dtype=args.dtype)
+    print(f"Indexed {len(chunks)} chunks into {args.out}")
+
+
+if __name__ == "__main__":
+    main()